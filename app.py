@@ -1,11 +1,20 @@
+import json
 import os
+import tempfile
+import time
 from datetime import datetime
 
 import pandas as pd
 import streamlit as st
 
+from batch_utils import iter_batch_analysis, iter_transcripts
+from digest import build_digest
+from export_utils import EXPORT_FORMATS, export_feed
 from llm_utils import analyze_call_with_llm, generate_product_insights
-from sheet_utils import get_google_sheet_data
+from search_index import get_search_index
+from sheet_utils import append_batch_to_google_sheet, get_google_sheet_data
+
+BATCH_WRITE_SIZE = 50
 
 st.set_page_config(page_title="LLM• Анализ звонков", page_icon="📊", layout="wide")
 st.markdown("""
@@ -26,7 +35,9 @@ def main():
         if sheet_url:
             st.session_state.sheet_url = sheet_url
 
-    tab1, tab2 = st.tabs(["Анализ звонка", "Просмотр инсайтов"])
+    tab1, tab_batch, tab2, tab_search, tab_digest = st.tabs(
+        ["Анализ звонка", "Пакетный анализ", "Просмотр инсайтов", "Поиск", "Дайджест"]
+    )
 
     with tab1:
         st.subheader("Ручной анализ звонка")
@@ -40,6 +51,9 @@ def main():
                 else:
                     st.error("Не удалось получить анализ. Проверьте ключи ЯндексGPT.")
 
+    with tab_batch:
+        render_batch_tab()
+
     with tab2:
         st.subheader("Просмотр продуктовых инсайтов")
         if st.button("Обновить данные"):
@@ -49,6 +63,170 @@ def main():
                 if feed_data:
                     df = pd.DataFrame(feed_data)
                     st.dataframe(df, use_container_width=True)
+        render_export_section()
+
+    with tab_search:
+        render_search_tab()
+
+    with tab_digest:
+        render_digest_tab()
+
+def render_export_section():
+    with st.expander("Экспорт фида"):
+        col1, col2, col3 = st.columns(3)
+        fmt = col1.selectbox("Формат:", EXPORT_FORMATS)
+        date_from = col2.date_input("С даты:", value=None)
+        date_to = col3.date_input("По дату:", value=None)
+        tags = st.text_input("Теги (через запятую):")
+
+        if not st.button("Подготовить файл"):
+            return
+
+        url = st.session_state.get('sheet_url')
+        # Строки пишутся в файл постранично; в память целиком не загружаются
+        path = os.path.join(tempfile.gettempdir(), f"insights_{datetime.now():%Y%m%d_%H%M%S}.{fmt}")
+        try:
+            with st.spinner("Выгружаем..."):
+                count = export_feed(
+                    path,
+                    fmt=fmt,
+                    sheet_url=url or None,
+                    date_from=date_from.isoformat() if date_from else None,
+                    date_to=date_to.isoformat() if date_to else None,
+                    tags=[t for t in tags.split(",") if t.strip()],
+                )
+            with open(path, "rb") as f:
+                data = f.read()
+        except Exception as e:
+            st.error(f"Ошибка экспорта: {e}")
+            return
+        finally:
+            # Файл нужен только чтобы собрать выгрузку; содержимое уже в data
+            if os.path.exists(path):
+                os.remove(path)
+
+        if not url:
+            st.caption("Таблица не указана — выгрузка из локального индекса; в старых записях "
+                       "страх и желаемое решение могут быть пусты.")
+        st.download_button(f"Скачать ({count} строк)", data, file_name=os.path.basename(path))
+
+
+def render_digest_tab():
+    st.subheader("Дайджест обращений за период")
+    days_back = st.slider("Дней:", 1, 28, 7)
+    url = st.session_state.get('sheet_url')
+    if not (st.button("Построить дайджест") and url):
+        return
+
+    with st.spinner("Собираем сводки..."):
+        digest = build_digest(url, days_back)
+    st.caption(f"Запросов к LLM: {digest['llm_calls']}")
+
+    for label, items in (("Неделя с", digest["weeks"]), ("День", digest["days"])):
+        for period in sorted(items, reverse=True):
+            summary = items[period]
+            with st.expander(f"{label} {period} — звонков: {summary['calls']}", expanded=label == "Неделя с"):
+                st.markdown(f'<div class="insight-box">{summary.get("summary", "")}</div>', unsafe_allow_html=True)
+                for title, key in (("Проблемы", "top_problems"), ("Страхи", "top_fears"),
+                                   ("Желаемые результаты", "desired_outcomes"), ("Цитаты", "notable_quotes")):
+                    st.write(f"**{title}:**")
+                    for item in summary.get(key) or []:
+                        st.write(f"• {item}")
+
+
+def render_search_tab():
+    st.subheader("Поиск по цитатам, проблемам и тегам")
+    index = get_search_index()
+    index.refresh()
+
+    query = st.text_input("Что говорили клиенты:", placeholder="деньги списали")
+    if query.strip():
+        started = time.perf_counter()
+        results = index.search(query, limit=200)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        st.caption(f"Найдено: {len(results)} из {len(index)} звонков за {elapsed_ms:.1f} мс")
+        if results:
+            df = pd.DataFrame(results)
+            df["original_phrases"] = df["original_phrases"].map(" | ".join)
+            df["tags"] = df["tags"].map(", ".join)
+            st.dataframe(df, use_container_width=True)
+
+    url = st.session_state.get('sheet_url')
+    if url and st.button("Перестроить индекс из таблицы"):
+        with st.spinner("Перестраиваем индекс..."):
+            records = get_google_sheet_data(url) or []
+            st.success(f"Проиндексировано звонков: {index.rebuild_from_records(records)}")
+
+
+def render_batch_tab():
+    st.subheader("Пакетный анализ звонков")
+    uploaded = st.file_uploader(
+        "Файлы расшифровок (TXT, CSV с колонкой transcript/text, ZIP):",
+        type=["txt", "csv", "zip"],
+        accept_multiple_files=True,
+    )
+    max_workers = st.slider("Параллельных запросов к LLM:", 1, 16, 4)
+    write_to_sheet = st.checkbox("Сразу записывать результаты в таблицу", value=True)
+
+    if not (st.button("Запустить пакетный анализ", type="primary") and uploaded):
+        return
+
+    url = st.session_state.get('sheet_url')
+    if write_to_sheet and not url:
+        st.warning("Укажите URL Google Таблицы в настройках — результаты не будут записаны.")
+
+    def transcripts():
+        return iter_transcripts((f.name, f.getvalue()) for f in uploaded)
+
+    # Счётный проход только ради прогресс-бара: тексты не копятся, анализ читает поток заново
+    total = sum(1 for _ in transcripts())
+    if not total:
+        st.error("В загруженных файлах не найдено расшифровок.")
+        return
+
+    progress = st.progress(0.0, text=f"0 / {total}")
+    table = st.empty()
+    rows, pending, written, failed = [], [], 0, 0
+    write_to_sheet, sheet_ok = write_to_sheet and bool(url), True
+
+    for i, result in enumerate(iter_batch_analysis(transcripts(), max_workers=max_workers), start=1):
+        analysis = result["analysis"] or {}
+        rows.append({
+            "Файл": result["name"],
+            "Проблема": analysis.get("main_problem", ""),
+            "Страх": analysis.get("key_fear", ""),
+            "Теги": ", ".join(analysis.get("tags", []) or []),
+            "Ошибка": result["error"] or "",
+        })
+        if result["error"]:
+            failed += 1
+        elif write_to_sheet:
+            pending.append((result["analysis"], result["insights"]))
+            if sheet_ok and len(pending) >= BATCH_WRITE_SIZE:
+                if append_batch_to_google_sheet(pending, url):
+                    written += len(pending)
+                    pending = []
+                else:
+                    # Не повторяем запись на каждом звонке: копим строки и пробуем ещё раз в конце
+                    sheet_ok = False
+                    st.error("Ошибка записи в Google Таблицу — запись отложена до конца пакета.")
+
+        progress.progress(i / total, text=f"{i} / {total}")
+        table.dataframe(pd.DataFrame(rows), use_container_width=True)
+
+    if pending and append_batch_to_google_sheet(pending, url):
+        written += len(pending)
+        pending = []
+
+    st.success(f"Готово: обработано {len(rows)}, ошибок {failed}, записано в таблицу {written}.")
+    if pending:
+        st.error(f"Не записано в таблицу: {len(pending)}. Результаты можно скачать ниже.")
+        st.download_button(
+            "Скачать незаписанные результаты (JSON)",
+            json.dumps([{"analysis": a, "insights": ins} for a, ins in pending], ensure_ascii=False, indent=2),
+            file_name="unwritten_results.json",
+        )
+
 
 def display_results(analysis, insights):
     st.success("✅ Анализ завершен!")
@@ -1,32 +1,57 @@
+import argparse
+import json
 import logging
 import os
+import signal
+import threading
 import time
 from datetime import datetime
-import schedule
+from typing import Optional
 from dotenv import load_dotenv
 
+# До импорта модулей проекта: часть из них читает настройки из окружения при импорте
+load_dotenv()
+
 from exolve_client import ExolveClient
 from llm_utils import LLMProcessor
 from sheet_utils import GoogleSheetsManager
+from search_index import get_search_index
+from profiling_utils import run_profiler
+from call_queue import CallPriorityQueue
+from json_utils import parse_stats
 
-load_dotenv()
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
 PROCESSED_FILE = "processed_calls.txt"
+# Окно выборки GetList; интервал опроса должен быть короче, иначе звонки теряются
+LIST_WINDOW_HOURS = 1
+# Сколько секунд может длиться один прогон; 0 — без ограничения
+RUN_TIME_BUDGET_SEC = float(os.getenv("RUN_TIME_BUDGET_SEC", "240"))
 
 
 class AutoCallProcessor:
-    def __init__(self, min_transcript_len: int = 100):
-        self.exolve_client = ExolveClient()
+    def __init__(
+            self,
+            min_transcript_len: int = 100,
+            run_budget_sec: float = RUN_TIME_BUDGET_SEC,
+            replay: Optional[bool] = None,
+    ):
+        self.exolve_client = ExolveClient(replay=replay)
         self.llm = LLMProcessor()
-        self.sheets = GoogleSheetsManager()
+        self.sheets = GoogleSheetsManager(search_index=get_search_index())
         self.sheet_url = os.getenv("GOOGLE_SHEETS_URL")
         if not self.sheet_url:
             raise RuntimeError("GOOGLE_SHEETS_URL is not set")
 
         self.min_transcript_len = min_transcript_len
         self.processed_uids = self._load_processed()
+        self.queue = CallPriorityQueue()
+        self.run_budget_sec = run_budget_sec
+        self.last_new_calls = 0
+        # Прогон остановился по бюджету, а в очереди остались звонки
+        self.budget_exhausted = False
+        self._stop_event = threading.Event()
 
     def _load_processed(self):
         if not os.path.exists(PROCESSED_FILE):
@@ -39,58 +64,182 @@ class AutoCallProcessor:
             for uid in sorted(self.processed_uids):
                 f.write(f"{uid}\n")
 
+    @run_profiler.profiled("process_new_calls")
     def process_new_calls(self) -> int:
         logger.info("Проверка новых звонков...")
-        calls = self.exolve_client.get_recent_calls(hours_back=1)
+        self.budget_exhausted = False
+        calls = self.exolve_client.get_recent_calls(hours_back=LIST_WINDOW_HOURS)
         logger.info(f"Найдено звонков: {len(calls)}")
 
-        processed_now = 0
+        new_calls = 0
         for call in calls:
             uid = call.get("uid") or call.get("id")
-            if not uid or str(uid) in self.processed_uids:
+            if not uid or str(uid) in self.processed_uids or uid in self.queue or self.queue.gave_up(uid):
                 continue
+            self.queue.push(call, self.exolve_client.get_call_details(int(uid)))
+            new_calls += 1
+        # Для адаптивного интервала важны только впервые увиденные звонки, а не хвост очереди
+        self.last_new_calls = new_calls
+        logger.info(f"Новых звонков: {new_calls}, в очереди: {len(self.queue)}")
 
-            logger.info(f"Обработка звонка uid={uid}")
-            transcript = self.exolve_client.get_call_transcript(int(uid))
-            if not transcript or len(transcript) < self.min_transcript_len:
-                logger.info(f"Транскрипт отсутствует или короткий (len={len(transcript) if transcript else 0})")
-                continue
-
-            analysis = self.llm.analyze_call(transcript)
-            if not analysis:
-                logger.warning(f"LLM-анализ не вернул результат (uid={uid})")
-                continue
-
-            insights = self.llm.generate_product_insights(analysis)
-            if not insights:
-                logger.warning(f"Инсайты не сгенерированы (uid={uid})")
-                continue
-
-            ok = self.sheets.append_analysis(self.sheet_url, analysis, insights)
-            if ok:
-                self.processed_uids.add(str(uid))
+        deadline = time.monotonic() + self.run_budget_sec if self.run_budget_sec else None
+        processed_now = 0
+        for entry in self.queue.iter_by_priority():
+            if self._stop_event.is_set():
+                logger.info("Получен сигнал остановки — оставшиеся звонки обработаем при следующем запуске")
+                break
+            if deadline is not None and time.monotonic() > deadline:
+                logger.info(f"Бюджет прогона исчерпан, в очереди осталось {len(self.queue)}")
+                self.budget_exhausted = True
+                break
+
+            uid = entry["uid"]
+            if self._process_call(uid):
+                self.processed_uids.add(uid)
+                self.queue.done(uid)
                 processed_now += 1
-                logger.info(f"Звонок {uid} сохранён в Google Sheets")
-            else:
-                logger.error(f"Ошибка сохранения звонка {uid} в Google Sheets")
+            elif not self.queue.defer(uid):
+                logger.info(f"Звонок {uid} снят с очереди после {self.queue.max_attempts} попыток")
 
+        self.queue.save()
         if processed_now:
             self._save_processed()
         logger.info(f"Обработано новых звонков: {processed_now}")
+        # Вебхук отдаёт эти счётчики в /health; демону их больше некуда выводить
+        stats = parse_stats.snapshot()
+        if stats:
+            logger.info(f"Разбор JSON: {json.dumps(stats, ensure_ascii=False)}")
+        return processed_now
+
+    def reprocess_archive(self, hours_back: int) -> int:
+        """
+        Повторный анализ звонков из архива Exolve за hours_back часов (например,
+        после смены промптов). В отличие от process_new_calls не смотрит на
+        processed_calls.txt и очередь и не меняет их. Клиент должен быть в режиме
+        воспроизведения (replay=True или EXOLVE_REPLAY=true).
+        """
+        if not self.exolve_client.replay:
+            raise RuntimeError("Повторный анализ работает только в режиме воспроизведения архива")
+
+        calls = self.exolve_client.get_recent_calls(hours_back=hours_back)
+        logger.info(f"Повторный анализ: звонков в архиве {len(calls)}")
+        processed_now = 0
+        for call in calls:
+            if self._stop_event.is_set():
+                break
+            uid = call.get("uid") or call.get("id")
+            if uid and self._process_call(str(uid)):
+                processed_now += 1
+        logger.info(f"Повторно проанализировано звонков: {processed_now}")
         return processed_now
 
-    def run_continuously(self, interval_minutes=5):
-        logger.info(f"Запуск с интервалом {interval_minutes} мин.")
-        self.process_new_calls()
-        schedule.every(interval_minutes).minutes.do(self.process_new_calls)
+    def _process_call(self, uid: str) -> bool:
+        logger.info(f"Обработка звонка uid={uid}")
+        transcript = self.exolve_client.get_call_transcript(int(uid))
+        if not transcript or len(transcript) < self.min_transcript_len:
+            logger.info(f"Транскрипт отсутствует или короткий (len={len(transcript) if transcript else 0})")
+            return False
+
+        analysis = self.llm.analyze_call(transcript)
+        if not analysis:
+            logger.warning(f"LLM-анализ не вернул результат (uid={uid})")
+            return False
+
+        insights = self.llm.generate_product_insights(analysis)
+        if not insights:
+            logger.warning(f"Инсайты не сгенерированы (uid={uid})")
+            return False
+
+        ok = self.sheets.append_analysis(self.sheet_url, analysis, insights)
+        if ok:
+            logger.info(f"Звонок {uid} сохранён в Google Sheets")
+        else:
+            logger.error(f"Ошибка сохранения звонка {uid} в Google Sheets")
+        return ok
+
+    def stop(self, *_):
+        """Просит сервис остановиться после текущего звонка."""
+        if not self._stop_event.is_set():
+            logger.info("Остановка сервиса: дожидаемся обработки текущего звонка...")
+        self._stop_event.set()
+
+    @staticmethod
+    def _next_interval(current: float, new_calls: int, min_interval: float, max_interval: float,
+                       busy_threshold: int, backlog: bool = False) -> float:
+        """
+        Чем больше новых звонков, тем чаще опрос; без звонков интервал растёт.
+        Если прогон упёрся в бюджет и звонки ждут в очереди (backlog), сервис
+        не простаивает — интервал не увеличивается.
+        """
+        if new_calls >= busy_threshold:
+            current /= 2
+        elif new_calls == 0 and not backlog:
+            current *= 1.5
+        return min(max(current, min_interval), max_interval)
+
+    def run_continuously(self, interval_minutes=5, min_interval_minutes=1, max_interval_minutes=30,
+                         busy_threshold=10):
+        """
+        Запуски идут строго последовательно: следующий планируется от начала
+        предыдущего, а если прогон затянулся — стартует сразу после него.
+        SIGTERM/SIGINT прерывают ожидание и дают дообработать текущий звонок.
+        Окно выборки звонков — 1 час, поэтому max_interval_minutes должен быть меньше 60.
+        """
+        if max_interval_minutes >= LIST_WINDOW_HOURS * 60:
+            raise ValueError(
+                f"max_interval_minutes={max_interval_minutes} не меньше окна выборки "
+                f"({LIST_WINDOW_HOURS * 60} мин.): звонки между проверками будут потеряны"
+            )
+        if not 0 < min_interval_minutes <= interval_minutes <= max_interval_minutes:
+            raise ValueError("Ожидается 0 < min_interval_minutes <= interval_minutes <= max_interval_minutes")
+
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        interval = interval_minutes * 60
+        min_interval, max_interval = min_interval_minutes * 60, max_interval_minutes * 60
+        logger.info(f"Запуск с интервалом {interval_minutes} мин. "
+                    f"(адаптивно {min_interval_minutes}–{max_interval_minutes} мин.)")
+
+        next_run = time.monotonic()
         try:
-            while True:
-                schedule.run_pending()
-                time.sleep(1)
-        except KeyboardInterrupt:
-            logger.info("Остановка сервиса...")
+            while not self._stop_event.is_set():
+                delay = next_run - time.monotonic()
+                if delay > 0 and self._stop_event.wait(delay):
+                    break
+
+                run_started = time.monotonic()
+                try:
+                    self.process_new_calls()
+                except Exception as e:
+                    logger.error(f"Ошибка обработки звонков: {e}")
+
+                interval = self._next_interval(interval, self.last_new_calls, min_interval, max_interval,
+                                               busy_threshold, backlog=self.budget_exhausted)
+                next_run = max(run_started + interval, time.monotonic())
+                logger.info(f"Следующая проверка через {max(0.0, next_run - time.monotonic()) / 60:.1f} мин.")
+        finally:
             self._save_processed()
+            self.queue.save()
+            logger.info("Сервис остановлен, состояние сохранено")
 
 
 if __name__ == "__main__":
-    AutoCallProcessor().run_continuously()
+    parser = argparse.ArgumentParser(description="Автоматическая обработка звонков Exolve")
+    parser.add_argument(
+        "--reprocess-hours",
+        type=int,
+        help="Однократно переанализировать звонки из архива за N часов (окно заканчивается "
+             "в EXOLVE_REPLAY_UNTIL, если задан) и выйти; обработанные ранее звонки не пропускаются",
+    )
+    args = parser.parse_args()
+
+    if args.reprocess_hours:
+        AutoCallProcessor(replay=True).reprocess_archive(args.reprocess_hours)
+    else:
+        AutoCallProcessor().run_continuously(
+            interval_minutes=float(os.getenv("POLL_INTERVAL_MINUTES", "5")),
+            min_interval_minutes=float(os.getenv("POLL_MIN_INTERVAL_MINUTES", "1")),
+            max_interval_minutes=float(os.getenv("POLL_MAX_INTERVAL_MINUTES", "30")),
+        )
@@ -0,0 +1,128 @@
+import csv
+import io
+import logging
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, Iterable, Iterator, Optional, Tuple
+
+from llm_utils import LLMProcessor
+
+logger = logging.getLogger(__name__)
+
+TEXT_EXTENSIONS = (".txt", ".text", ".md")
+CSV_TEXT_COLUMNS = ("transcript", "text", "call_text", "расшифровка", "текст")
+MIN_TRANSCRIPT_LEN = 20
+
+
+def _decode(raw: bytes) -> str:
+    """Расшифровки встречаются и в UTF-8, и в выгрузках из Windows (cp1251)."""
+    for encoding in ("utf-8-sig", "cp1251"):
+        try:
+            return raw.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return raw.decode("utf-8", errors="replace")
+
+
+def _iter_csv(name: str, raw: bytes) -> Iterator[Tuple[str, str]]:
+    reader = csv.reader(io.StringIO(_decode(raw)))
+    header = next(reader, None)
+    if not header:
+        return
+
+    lowered = [h.strip().lower() for h in header]
+    column = next((lowered.index(c) for c in CSV_TEXT_COLUMNS if c in lowered), None)
+    if column is None:
+        # Нет узнаваемого заголовка — первая строка тоже данные, текст в первой колонке
+        column = 0
+        if header[0].strip():
+            yield f"{name}#1", header[0].strip()
+
+    for line_no, row in enumerate(reader, start=2):
+        if column < len(row) and row[column].strip():
+            yield f"{name}#{line_no}", row[column].strip()
+
+
+def iter_transcripts(files: Iterable[Tuple[str, bytes]]) -> Iterator[Tuple[str, str]]:
+    """
+    Разворачивает загруженные файлы в пары (имя, текст расшифровки).
+    Поддерживаются текстовые файлы, CSV (одна строка — один звонок)
+    и ZIP-архивы с такими файлами. Архив читается по одному члену за раз.
+    """
+    for name, raw in files:
+        lower = name.lower()
+        if lower.endswith(".zip"):
+            try:
+                with zipfile.ZipFile(io.BytesIO(raw)) as archive:
+                    members = [m for m in archive.infolist() if not m.is_dir()]
+                    yield from iter_transcripts(
+                        (f"{name}/{m.filename}", archive.read(m)) for m in members
+                    )
+            except zipfile.BadZipFile as e:
+                logger.error(f"Не удалось прочитать архив {name}: {e}")
+        elif lower.endswith(".csv"):
+            yield from _iter_csv(name, raw)
+        elif lower.endswith(TEXT_EXTENSIONS):
+            text = _decode(raw).strip()
+            if text:
+                yield name, text
+        else:
+            logger.info(f"Пропущен файл неподдерживаемого формата: {name}")
+
+
+def _analyze_one(processor: LLMProcessor, name: str, text: str) -> Dict[str, Any]:
+    result = {"name": name, "analysis": None, "insights": None, "error": None}
+    if len(text) < MIN_TRANSCRIPT_LEN:
+        result["error"] = "Слишком короткая расшифровка"
+        return result
+
+    analysis = processor.analyze_call(text)
+    if not analysis:
+        result["error"] = "LLM-анализ не вернул результат"
+        return result
+
+    result["analysis"] = analysis
+    result["insights"] = processor.generate_product_insights(analysis)
+    if not result["insights"]:
+        result["error"] = "Инсайты не сгенерированы"
+    return result
+
+
+def iter_batch_analysis(
+        transcripts: Iterable[Tuple[str, str]],
+        max_workers: Optional[int] = None,
+        processor: Optional[LLMProcessor] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Анализирует расшифровки параллельно и отдаёт результаты по мере готовности.
+    В работе одновременно не больше max_workers задач — входной поток
+    читается лениво, так что сотни файлов не держатся в памяти целиком.
+    """
+    max_workers = max_workers or int(os.getenv("BATCH_MAX_WORKERS", "4"))
+    processor = processor or LLMProcessor()
+    source = iter(transcripts)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight: Dict[Any, str] = {}
+        exhausted = False
+        while True:
+            while not exhausted and len(in_flight) < max_workers:
+                item = next(source, None)
+                if item is None:
+                    exhausted = True
+                    break
+                name, text = item
+                in_flight[executor.submit(_analyze_one, processor, name, text)] = name
+
+            if not in_flight:
+                return
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = in_flight.pop(future)
+                try:
+                    yield future.result()
+                except Exception as e:
+                    logger.error(f"Ошибка пакетного анализа {name}: {e}")
+                    yield {"name": name, "analysis": None, "insights": None, "error": str(e)}
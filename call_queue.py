@@ -0,0 +1,198 @@
+import heapq
+import json
+import logging
+import os
+import time
+from typing import Dict, Any, Iterator, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+QUEUE_FILE = os.getenv("CALL_QUEUE_FILE", "call_queue.json")
+PRIORITY_NUMBERS = os.getenv("PRIORITY_NUMBERS", "")
+PRIORITY_NUMBERS_FILE = os.getenv("PRIORITY_NUMBERS_FILE", "")
+# Очки за минуту ожидания: даже звонок с низким скором со временем обгонит новые
+AGING_PER_MINUTE = float(os.getenv("QUEUE_AGING_PER_MINUTE", "0.5"))
+MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "6"))
+REPEAT_WINDOW_SEC = 24 * 3600
+
+MISDIAL_SEC = 15
+DURATION_KEYS = ("duration", "billsec", "talk_duration", "call_duration")
+DIRECTION_KEYS = ("direction", "call_direction", "type")
+CALLER_KEYS = ("number_a", "from", "caller")
+CALLEE_KEYS = ("number_b", "to", "callee")
+CLIENT_NUMBER_KEYS = ("client_number",) + CALLER_KEYS + CALLEE_KEYS
+INCOMING_VALUES = {"incoming", "inbound", "in", "входящий", "1"}
+OUTGOING_VALUES = {"outgoing", "outbound", "out", "исходящий", "2"}
+
+
+def _normalize_number(value: Any) -> str:
+    digits = "".join(ch for ch in str(value or "") if ch.isdigit())
+    # 8XXXXXXXXXX и 7XXXXXXXXXX — один и тот же номер
+    if len(digits) == 11 and digits[0] == "8":
+        digits = "7" + digits[1:]
+    return digits
+
+
+def load_priority_numbers() -> Set[str]:
+    """Номера ключевых клиентов из ENV PRIORITY_NUMBERS и файла PRIORITY_NUMBERS_FILE."""
+    numbers = {_normalize_number(n) for n in PRIORITY_NUMBERS.split(",") if n.strip()}
+    if PRIORITY_NUMBERS_FILE and os.path.exists(PRIORITY_NUMBERS_FILE):
+        with open(PRIORITY_NUMBERS_FILE, "r", encoding="utf-8") as f:
+            numbers.update(_normalize_number(line) for line in f if line.strip())
+    numbers.discard("")
+    return numbers
+
+
+def _first(meta: Dict[str, Any], keys) -> Any:
+    for key in keys:
+        if meta.get(key) not in (None, ""):
+            return meta[key]
+    return None
+
+
+def client_number(meta: Dict[str, Any]) -> str:
+    """Номер клиента: у исходящего звонка это вызываемый номер, а не линия компании."""
+    if meta.get("client_number"):
+        return _normalize_number(meta["client_number"])
+    direction = str(_first(meta, DIRECTION_KEYS) or "").lower()
+    keys = CALLEE_KEYS if direction in OUTGOING_VALUES else CALLER_KEYS
+    return _normalize_number(_first(meta, keys))
+
+
+def score_call(meta: Dict[str, Any], priority_numbers: Set[str], repeat_count: int = 0) -> float:
+    """
+    Ценность звонка для анализа по метаданным GetList/GetInfo:
+    длительность, направление, номер из списка ключевых клиентов, повторное обращение.
+    """
+    score = 0.0
+
+    try:
+        duration = float(_first(meta, DURATION_KEYS) or 0)
+    except (TypeError, ValueError):
+        duration = 0.0
+    if duration and duration < MISDIAL_SEC:
+        score -= 20
+    else:
+        score += min(duration / 60, 40)
+
+    direction = str(_first(meta, DIRECTION_KEYS) or "").lower()
+    if direction in INCOMING_VALUES:
+        score += 10
+
+    numbers = {_normalize_number(meta.get(key)) for key in CLIENT_NUMBER_KEYS}
+    if numbers & priority_numbers:
+        score += 50
+
+    score += min(repeat_count * 5, 20)
+    return score
+
+
+class CallPriorityQueue:
+    """
+    Очередь звонков на обработку, упорядоченная по скору с поправкой на
+    время ожидания. Хранится на диске: звонки, не уложившиеся в бюджет
+    прогона, дождутся следующего, даже если выпали из окна GetList.
+    Звонки, исчерпавшие попытки, запоминаются на сутки, чтобы не вернуться
+    в очередь из того же окна GetList.
+    """
+
+    def __init__(
+            self,
+            path: str = QUEUE_FILE,
+            priority_numbers: Optional[Set[str]] = None,
+            aging_per_minute: float = AGING_PER_MINUTE,
+            max_attempts: int = MAX_ATTEMPTS,
+    ):
+        self.path = path
+        self.priority_numbers = load_priority_numbers() if priority_numbers is None else priority_numbers
+        self.aging_per_minute = aging_per_minute
+        self.max_attempts = max_attempts
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._recent_numbers: Dict[str, List[float]] = {}
+        self._given_up: Dict[str, float] = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._pending = data.get("pending", {})
+            self._recent_numbers = data.get("recent_numbers", {})
+            self._given_up = data.get("given_up", {})
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Файл очереди повреждён, начинаем с пустой очереди: {e}")
+
+    def save(self):
+        cutoff = time.time() - REPEAT_WINDOW_SEC
+        self._recent_numbers = {
+            number: [ts for ts in stamps if ts >= cutoff]
+            for number, stamps in self._recent_numbers.items()
+            if any(ts >= cutoff for ts in stamps)
+        }
+        self._given_up = {uid: ts for uid, ts in self._given_up.items() if ts >= cutoff}
+        state = {"pending": self._pending, "recent_numbers": self._recent_numbers, "given_up": self._given_up}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def __contains__(self, uid) -> bool:
+        return str(uid) in self._pending
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def gave_up(self, uid) -> bool:
+        return str(uid) in self._given_up
+
+    def push(self, call: Dict[str, Any], details: Optional[Dict[str, Any]] = None):
+        uid = str(call.get("uid") or call.get("id"))
+        if uid in self._pending or uid in self._given_up:
+            return
+
+        meta = dict(call, **(details or {}))
+        now = time.time()
+        number = client_number(meta)
+        repeat_count = 0
+        if number:
+            stamps = self._recent_numbers.setdefault(number, [])
+            repeat_count = sum(1 for ts in stamps if now - ts <= REPEAT_WINDOW_SEC)
+            stamps.append(now)
+
+        self._pending[uid] = {
+            "uid": uid,
+            "score": score_call(meta, self.priority_numbers, repeat_count),
+            "first_seen": now,
+            "attempts": 0,
+        }
+
+    def effective_priority(self, entry: Dict[str, Any], now: Optional[float] = None) -> float:
+        waited_minutes = ((now or time.time()) - entry["first_seen"]) / 60
+        return entry["score"] + self.aging_per_minute * waited_minutes
+
+    def iter_by_priority(self) -> Iterator[Dict[str, Any]]:
+        """Звонки от самого ценного к наименее ценному на момент вызова."""
+        now = time.time()
+        heap = [(-self.effective_priority(e, now), e["first_seen"], uid) for uid, e in self._pending.items()]
+        heapq.heapify(heap)
+        while heap:
+            _, _, uid = heapq.heappop(heap)
+            if uid in self._pending:
+                yield self._pending[uid]
+
+    def done(self, uid):
+        self._pending.pop(str(uid), None)
+
+    def defer(self, uid) -> bool:
+        """Звонок не удалось обработать сейчас. False — попытки исчерпаны, звонок снят с очереди."""
+        entry = self._pending.get(str(uid))
+        if entry is None:
+            return False
+        entry["attempts"] += 1
+        if entry["attempts"] >= self.max_attempts:
+            self.done(uid)
+            self._given_up[str(uid)] = time.time()
+            return False
+        return True
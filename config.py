@@ -10,5 +10,7 @@ LLM_CONFIG = {
         "model": os.getenv("YANDEX_MODEL", "yandexgpt-lite"),
         "temperature": float(os.getenv("YANDEX_TEMPERATURE", "0.3")),
         "max_tokens": int(os.getenv("YANDEX_MAX_TOKENS", "2000")),
+        # Сколько раз дозапрашивать невалидные поля JSON-ответа
+        "json_reask_attempts": int(os.getenv("YANDEX_JSON_REASK_ATTEMPTS", "1")),
     }
 }
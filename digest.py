@@ -0,0 +1,184 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+from datetime import date, timedelta
+from typing import Dict, Any, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+from llm_utils import LLMProcessor
+
+logger = logging.getLogger(__name__)
+
+DIGEST_CACHE_FILE = os.getenv("DIGEST_CACHE_FILE", "digest_cache.json")
+DIGEST_CHUNK_SIZE = int(os.getenv("DIGEST_CHUNK_SIZE", "25"))
+REDUCE_FANOUT = 8
+# Узлы, к которым не обращались дольше, удаляются из кэша
+CACHE_TTL_DAYS = 60
+
+
+def _fingerprint(*parts: Any) -> str:
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _record_to_call(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Строка листа -> компактный разбор звонка для промпта."""
+    return {
+        "timestamp": str(record.get("Timestamp", "")),
+        "main_problem": record.get("Main Problem", ""),
+        "key_fear": record.get("Key Fear", ""),
+        "result_solution": record.get("Desired Solution", ""),
+        "original_phrases": [p for p in str(record.get("Original Phrases", "")).split(" | ") if p][:3],
+        "tags": [t for t in str(record.get("Tags", "")).split(" | ") if t],
+    }
+
+
+class DigestEngine:
+    """
+    Дневные и недельные сводки по разборам звонков методом map-reduce.
+    Звонки дня режутся на пачки по chunk_size в порядке времени: пачка -> сводка
+    (map), сводки пачек -> сводка дня, сводки дней -> сводка недели (reduce).
+    Каждый узел кэшируется по отпечатку своего содержимого, поэтому после
+    новых звонков пересчитываются только последняя пачка дня, сводка этого
+    дня и недели — несколько запросов к LLM вместо полного пересчёта.
+    """
+
+    def __init__(
+            self,
+            llm: Optional[LLMProcessor] = None,
+            path: str = DIGEST_CACHE_FILE,
+            chunk_size: int = DIGEST_CHUNK_SIZE,
+    ):
+        self.llm = llm or LLMProcessor()
+        self.path = path
+        self.chunk_size = chunk_size
+        self.llm_calls = 0
+        self._nodes: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Кэш дайджестов повреждён, начинаем заново: {e}")
+            return {}
+
+    def save(self):
+        cutoff = (date.today() - timedelta(days=CACHE_TTL_DAYS)).isoformat()
+        self._nodes = {k: v for k, v in self._nodes.items() if v["used"] >= cutoff}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._nodes, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _node(self, key: str, compute, cacheable: bool = True) -> Optional[Dict[str, Any]]:
+        node = self._nodes.get(key) if cacheable else None
+        if node is None:
+            summary = compute()
+            self.llm_calls += 1
+            if summary is None or summary.get("fallback") or not cacheable:
+                # Сводка без LLM (сбой запроса или разбора) не кэшируется — пересчитаем в следующий раз
+                return summary
+            node = self._nodes[key] = {"summary": summary}
+        node["used"] = date.today().isoformat()
+        return node["summary"]
+
+    def _reduce(self, children: List[Dict[str, Any]], keys: List[str], period: str) -> Optional[Dict[str, Any]]:
+        if len(children) == 1:
+            return children[0]
+        if len(children) > REDUCE_FANOUT:
+            # Слишком много сводок для одного промпта — сворачиваем деревом
+            merged, merged_keys = [], []
+            for i in range(0, len(children), REDUCE_FANOUT):
+                group_keys = keys[i:i + REDUCE_FANOUT]
+                summary = self._reduce(children[i:i + REDUCE_FANOUT], group_keys, period)
+                if summary is not None:
+                    merged.append(summary)
+                    merged_keys.append(_fingerprint(group_keys))
+            return self._reduce(merged, merged_keys, period) if merged else None
+        key = _fingerprint("reduce", period, keys)
+        # Узел поверх фолбек-сводки тоже временный: её отпечаток совпадёт с будущей настоящей
+        cacheable = not any(c.get("fallback") for c in children)
+        return self._node(key, lambda: self.llm.merge_summaries(children, period), cacheable)
+
+    def _day(self, day: str, calls: List[Dict[str, Any]]):
+        """Сводка дня и её отпечаток (по отпечаткам пачек)."""
+        calls = sorted(calls, key=lambda c: (c["timestamp"], c["main_problem"]))
+        summaries, keys = [], []
+        for i in range(0, len(calls), self.chunk_size):
+            chunk = calls[i:i + self.chunk_size]
+            key = _fingerprint("map", chunk)
+            summary = self._node(key, lambda chunk=chunk: self.llm.summarize_calls(chunk))
+            if summary is not None:
+                summaries.append(summary)
+                keys.append(key)
+        if not summaries:
+            return None, None
+        return self._reduce(summaries, keys, f"день {day}"), _fingerprint(keys)
+
+    def build(self, records: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Сводки по всем дням и ISO-неделям, встречающимся в records
+        (строки листа в формате get_all_records / iter_rows).
+        """
+        self.llm_calls = 0
+        by_day: Dict[str, List[Dict[str, Any]]] = {}
+        for record in records:
+            call = _record_to_call(record)
+            if len(call["timestamp"]) >= 10:
+                by_day.setdefault(call["timestamp"][:10], []).append(call)
+
+        days, weeks = {}, {}
+        for day in sorted(by_day):
+            summary, key = self._day(day, by_day[day])
+            if summary is None:
+                continue
+            days[day] = dict(summary, calls=len(by_day[day]))
+            week_start = (date.fromisoformat(day) - timedelta(days=date.fromisoformat(day).weekday())).isoformat()
+            weeks.setdefault(week_start, []).append((day, summary, key))
+
+        weekly = {}
+        for week_start, items in weeks.items():
+            summary = self._reduce(
+                [s for _, s, _ in items], [k for _, _, k in items], f"неделю с {week_start}"
+            )
+            if summary is not None:
+                weekly[week_start] = dict(summary, calls=sum(days[d]["calls"] for d, _, _ in items))
+
+        self.save()
+        logger.info(f"Дайджест построен: дней {len(days)}, недель {len(weekly)}, запросов к LLM {self.llm_calls}")
+        return {"days": days, "weeks": weekly, "llm_calls": self.llm_calls}
+
+
+def build_digest(sheet_url: str, days_back: int = 7, engine: Optional[DigestEngine] = None) -> Dict[str, Any]:
+    """Дайджест за последние days_back дней, начиная с понедельника первой недели."""
+    from sheet_utils import get_sheets_manager
+
+    start = date.today() - timedelta(days=days_back - 1)
+    start -= timedelta(days=start.weekday())
+    records = get_sheets_manager().iter_rows(sheet_url, date_from=f"{start.isoformat()} 00:00:00")
+    return (engine or DigestEngine()).build(records)
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Дневные и недельные дайджесты обращений")
+    parser.add_argument("--sheet-url", default=os.getenv("GOOGLE_SHEETS_URL"))
+    parser.add_argument("--days", type=int, default=7)
+    args = parser.parse_args()
+    if not args.sheet_url:
+        raise RuntimeError("GOOGLE_SHEETS_URL is not set")
+
+    digest = build_digest(args.sheet_url, args.days)
+    print(json.dumps(digest, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: межпроцессной блокировки нет
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Настройки читаются при создании архива/клиента, а не при импорте: .env может загрузиться позже.
+# EXOLVE_ARCHIVE_DIR — каталог архива (пусто — архив выключен);
+# EXOLVE_REPLAY_UNTIL — момент, относительно которого в режиме воспроизведения
+#   считается окно get_recent_calls;
+# EXOLVE_ARCHIVE_RETENTION_DAYS — архив хранит сырые расшифровки: дни старше срока удаляются, 0 — хранить всё.
+DEFAULT_ARCHIVE_DIR = "exolve_archive"
+DEFAULT_RETENTION_DAYS = 90
+
+INDEX_FILE = "index.jsonl"
+# Отдельный файл блокировки: сам индекс при сжатии заменяется новым файлом
+INDEX_LOCK_FILE = "index.lock"
+LIST_KIND = "getlist"
+
+
+def archive_dir() -> str:
+    return os.getenv("EXOLVE_ARCHIVE_DIR", DEFAULT_ARCHIVE_DIR)
+
+
+def replay_enabled() -> bool:
+    return os.getenv("EXOLVE_REPLAY", "false").lower() == "true"
+
+
+def _parse_ts(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class ExolveArchive:
+    """
+    Append-only архив сырых ответов Exolve: {root}/YYYY-MM-DD/{kind}.jsonl.gz.
+    Каждая запись — отдельный gzip-член, поэтому файл дописывается без
+    перепаковки и читается обычным gzip.open. Индекс {root}/index.jsonl
+    хранит смещение записи по (kind, uid) — ответ достаётся одним seek.
+    """
+
+    def __init__(self, root: Optional[str] = None, retention_days: Optional[int] = None):
+        self.root = root or archive_dir()
+        if retention_days is None:
+            retention_days = int(os.getenv("EXOLVE_ARCHIVE_RETENTION_DAYS", str(DEFAULT_RETENTION_DAYS)))
+        self.replay_until = os.getenv("EXOLVE_REPLAY_UNTIL", "")
+        self._lock = threading.Lock()
+        self._index: Dict[Tuple[str, str], Tuple[str, int]] = {}
+        self._index_offset = 0
+        self._index_inode: Optional[int] = None
+        os.makedirs(self.root, exist_ok=True)
+        if retention_days > 0:
+            self.prune(retention_days)
+        self._refresh_index()
+
+    @contextmanager
+    def _index_file_lock(self):
+        """Межпроцессная блокировка записи в индекс (fcntl, если доступен)."""
+        with open(os.path.join(self.root, INDEX_LOCK_FILE), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def prune(self, retention_days: int) -> int:
+        """
+        Удаляет каталоги дней старше retention_days и сжимает индекс: остаются
+        только последние записи по (kind, uid), чьи файлы ещё существуют.
+        """
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).strftime("%Y-%m-%d")
+        removed = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if len(name) == 10 and name < cutoff and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        if removed:
+            logger.info(f"Из архива Exolve удалено дней: {removed}")
+            self._compact_index()
+        return removed
+
+    def _compact_index(self):
+        path = os.path.join(self.root, INDEX_FILE)
+        if not os.path.exists(path):
+            return
+        with self._lock, self._index_file_lock():
+            latest: Dict[Tuple[str, str], Dict[str, Any]] = {}
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    latest[(entry["kind"], str(entry["uid"]))] = entry
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for entry in latest.values():
+                    if os.path.exists(os.path.join(self.root, entry["file"])):
+                        f.write(json.dumps(entry) + "\n")
+            os.replace(tmp_path, path)
+            # Другие процессы заметят новый inode в _refresh_index и перечитают индекс
+            self._index, self._index_offset, self._index_inode = {}, 0, None
+
+    def _refresh_index(self):
+        path = os.path.join(self.root, INDEX_FILE)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._index_inode or stat.st_size < self._index_offset:
+            # Индекс заменён при сжатии — читаем заново
+            self._index, self._index_offset, self._index_inode = {}, 0, stat.st_ino
+        if stat.st_size == self._index_offset:
+            return
+        with open(path, "rb") as f:
+            f.seek(self._index_offset)
+            for line in iter(f.readline, b""):
+                if not line.endswith(b"\n"):
+                    break
+                self._index_offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._index[(entry["kind"], str(entry["uid"]))] = (entry["file"], entry["offset"])
+
+    def record(self, kind: str, payload: Dict[str, Any], response: Dict[str, Any]):
+        """Сохраняет ответ API. Ошибки записи логируются и не мешают основной работе."""
+        now = datetime.now(timezone.utc)
+        uid = payload.get("uid")
+        line = json.dumps(
+            {"ts": now.isoformat(), "kind": kind, "uid": uid, "request": payload, "response": response},
+            ensure_ascii=False,
+        ) + "\n"
+        rel_path = os.path.join(now.strftime("%Y-%m-%d"), f"{kind}.jsonl.gz")
+
+        try:
+            with self._lock:
+                os.makedirs(os.path.join(self.root, os.path.dirname(rel_path)), exist_ok=True)
+                with open(os.path.join(self.root, rel_path), "ab") as f:
+                    offset = f.tell()
+                    f.write(gzip.compress(line.encode("utf-8")))
+                if uid is not None:
+                    entry = {"kind": kind, "uid": str(uid), "file": rel_path, "offset": offset}
+                    with self._index_file_lock(), open(os.path.join(self.root, INDEX_FILE), "a", encoding="utf-8") as f:
+                        f.write(json.dumps(entry) + "\n")
+                    self._index[(kind, str(uid))] = (rel_path, offset)
+        except OSError as e:
+            logger.error(f"Ошибка записи в архив Exolve: {e}")
+
+    def _read_at(self, rel_path: str, offset: int) -> Optional[Dict[str, Any]]:
+        with open(os.path.join(self.root, rel_path), "rb") as f:
+            f.seek(offset)
+            line = gzip.GzipFile(fileobj=f).readline()
+        return json.loads(line) if line else None
+
+    def _iter_file(self, rel_path: str) -> Iterator[Dict[str, Any]]:
+        path = os.path.join(self.root, rel_path)
+        if not os.path.exists(path):
+            return
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def lookup(self, kind: str, uid) -> Optional[Dict[str, Any]]:
+        """Последний сохранённый ответ для uid или None."""
+        key = (kind, str(uid))
+        with self._lock:
+            if key not in self._index:
+                self._refresh_index()
+            location = self._index.get(key)
+        if location is None:
+            return None
+
+        try:
+            record = self._read_at(*location)
+        except (OSError, EOFError, json.JSONDecodeError):
+            record = None
+        if record is None or str(record.get("uid")) != str(uid) or record.get("kind") != kind:
+            # Смещение могло сбиться при одновременной записи из двух процессов — ищем перебором
+            matches = [r for r in self._iter_file(location[0]) if str(r.get("uid")) == str(uid)]
+            record = matches[-1] if matches else None
+        return record["response"] if record else None
+
+    def iter_calls(self, date_from: datetime, date_to: datetime) -> Iterator[Dict[str, Any]]:
+        """Уникальные звонки из ответов GetList, полученных в заданный период."""
+        seen = set()
+        day = date_from.date()
+        while day <= date_to.date():
+            for record in self._iter_file(os.path.join(day.isoformat(), f"{LIST_KIND}.jsonl.gz")):
+                if not date_from <= _parse_ts(record["ts"]) <= date_to:
+                    continue
+                response = record["response"] or {}
+                for call in response.get("calls") or response.get("list") or []:
+                    uid = call.get("uid") or call.get("id")
+                    if uid not in seen:
+                        seen.add(uid)
+                        yield call
+            day += timedelta(days=1)
+
+    def replay_list(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Ответ GetList из архива. Окно той же длины, что в запросе, но
+        заканчивается в EXOLVE_REPLAY_UNTIL (если задан) — так можно
+        переиграть любой исторический период.
+        """
+        date_from, date_to = _parse_ts(payload["date_from"]), _parse_ts(payload["date_to"])
+        if self.replay_until:
+            until = _parse_ts(self.replay_until)
+            if until.tzinfo is None:
+                until = until.replace(tzinfo=timezone.utc)
+            date_from, date_to = until - (date_to - date_from), until
+        return {"calls": list(self.iter_calls(date_from, date_to))}
@@ -1,96 +1,151 @@
+import asyncio
 import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional
 import os
 
+try:
+    import aiohttp
+except ImportError:  # асинхронный клиент опционален
+    aiohttp = None
+
+from exolve_archive import LIST_KIND, ExolveArchive, archive_dir, replay_enabled
+
 logger = logging.getLogger(__name__)
 
+GET_LIST_URL = "https://api.exolve.ru/statistics/call-history/v2/GetList"
+GET_INFO_URL = "https://api.exolve.ru/statistics/call-history/v2/GetInfo"
+GET_TRANSCRIBATION_URL = "https://api.exolve.ru/statistics/call-record/v1/GetTranscribation"
+
+ARCHIVE_KINDS = {
+    GET_LIST_URL: LIST_KIND,
+    GET_INFO_URL: "info",
+    GET_TRANSCRIBATION_URL: "transcribation",
+}
+
+
+def _default_archive(archive: Optional[ExolveArchive], replay: bool) -> Optional[ExolveArchive]:
+    if archive is None and archive_dir():
+        archive = ExolveArchive()
+    if replay and archive is None:
+        raise RuntimeError("Режим воспроизведения требует архива: задайте EXOLVE_ARCHIVE_DIR")
+    return archive
+
+
+def _replay_response(archive: ExolveArchive, url: str, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Ответ из архива вместо запроса к API; None, если такого ответа не сохранялось."""
+    kind = ARCHIVE_KINDS[url]
+    if kind == LIST_KIND:
+        return archive.replay_list(payload)
+    return archive.lookup(kind, payload["uid"])
+
+
+def _recent_calls_payload(hours_back: int) -> Dict[str, Any]:
+    end_time = datetime.now(timezone.utc)
+    start_time = end_time - timedelta(hours=hours_back)
+    return {
+        "date_from": start_time.isoformat().replace("+00:00", "Z"),
+        "date_to": end_time.isoformat().replace("+00:00", "Z"),
+        "limit": 50,
+        "offset": 0
+    }
+
+
+def _parse_calls(data: Dict[str, Any]) -> List[Dict]:
+    return data.get("calls") or data.get("list") or []
+
+
+def _parse_transcript(call_uid: int, resp: Dict[str, Any]) -> Optional[str]:
+    """Склеивает фразы из ответа GetTranscribation в один текст."""
+    items = resp.get("transcribation") or []
+    if not items:
+        logger.warning(f"Транскрипция для звонка {call_uid} не найдена.")
+        return None
+
+    item = items[0]
+    chunks = item.get("chunks")
+    if isinstance(chunks, dict):
+        chunks = [chunks]
+
+    phrases = []
+    for ch in (chunks or []):
+        text = (ch.get("text") or "").strip()
+        if text:
+            phrases.append(text)
+
+    transcript_text = " ".join(phrases) if phrases else None
+    if transcript_text:
+        logger.info(f"Получена расшифровка для звонка {call_uid}: {len(transcript_text)} символов")
+        return transcript_text
+    else:
+        logger.warning(f"Пустая расшифровка для звонка {call_uid}")
+        return None
+
 
 class ExolveClient:
-    def __init__(self):
+    """
+    Клиент статистики Exolve. Все ответы API пишутся в локальный архив
+    (EXOLVE_ARCHIVE_DIR, пустое значение отключает архив). При EXOLVE_REPLAY=true
+    ответы берутся из архива без обращения к API.
+    """
+
+    def __init__(self, archive: Optional[ExolveArchive] = None, replay: Optional[bool] = None):
+        self.replay = replay_enabled() if replay is None else replay
+        self.archive = _default_archive(archive, self.replay)
         self.api_key = os.getenv("EXOLVE_API_KEY")
         self.base_url = "https://api.exolve.ru/statistics/call-record/v1"
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        self._transcript_catalog = None
+
+    def _post(self, url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if self.replay:
+            data = _replay_response(self.archive, url, payload)
+            if data is None:
+                raise requests.exceptions.RequestException(f"Ответа нет в архиве: {url} {payload}")
+            return data
+
+        response = requests.post(url, headers=self.headers, json=payload, timeout=30)
+        response.raise_for_status()
+        data = response.json()
+        if not isinstance(data, dict):
+            raise requests.exceptions.RequestException(f"Ответ API не является JSON-объектом: {url}")
+        if self.archive is not None:
+            self.archive.record(ARCHIVE_KINDS[url], payload, data)
+        return data
 
     def get_recent_calls(self, hours_back: int = 1) -> List[Dict]:
         """Получает список последних звонков"""
         try:
-            end_time = datetime.now(timezone.utc)
-            start_time = end_time - timedelta(hours=hours_back)
-
-            url = "https://api.exolve.ru/statistics/call-history/v2/GetList"
-            payload = {
-                "date_from": start_time.isoformat().replace("+00:00", "Z"),
-                "date_to": end_time.isoformat().replace("+00:00", "Z"),
-                "limit": 50,
-                "offset": 0
-            }
-
-            response = requests.post(url, headers=self.headers, json=payload, timeout=30)
-            response.raise_for_status()
-
-            data = response.json()
-            return data.get("calls") or data.get("list") or []
-
+            return _parse_calls(self._post(GET_LIST_URL, _recent_calls_payload(hours_back)))
         except requests.exceptions.RequestException as e:
             logger.error(f"API Error: {e}")
             return []
 
-    def get_call_transcript(self, call_uid: int) -> Optional[str]:
-        """Получает транскрипцию звонка через POST /GetTranscribation"""
+    def get_call_transcript(self, call_uid: int, raise_errors: bool = False) -> Optional[str]:
+        """
+        Получает транскрипцию звонка через POST /GetTranscribation.
+        None — расшифровки нет; при raise_errors=True сбой запроса пробрасывается,
+        чтобы его можно было отличить от отсутствия расшифровки.
+        """
         try:
             logger.info(f"Получение расшифровки для звонка {call_uid}")
-
-            url = "https://api.exolve.ru/statistics/call-record/v1/GetTranscribation"
-            payload = {"uid": int(call_uid)}
-
-            response = requests.post(url, headers=self.headers, json=payload, timeout=30)
-            response.raise_for_status()
-
-            resp = response.json()
-            items = resp.get("transcribation") or []
-            if not items:
-                logger.warning(f"Транскрипция для звонка {call_uid} не найдена.")
-                return None
-
-            item = items[0]
-            chunks = item.get("chunks")
-            if isinstance(chunks, dict):
-                chunks = [chunks]
-
-            phrases = []
-            for ch in (chunks or []):
-                text = (ch.get("text") or "").strip()
-                if text:
-                    phrases.append(text)
-
-            transcript_text = " ".join(phrases) if phrases else None
-            if transcript_text:
-                logger.info(f"Получена расшифровка для звонка {call_uid}: {len(transcript_text)} символов")
-                return transcript_text
-            else:
-                logger.warning(f"Пустая расшифровка для звонка {call_uid}")
-                return None
-
+            resp = self._post(GET_TRANSCRIBATION_URL, {"uid": int(call_uid)})
+            return _parse_transcript(call_uid, resp)
         except requests.exceptions.RequestException as e:
             logger.error(f"Ошибка получения транскрипции для звонка {call_uid}: {e}")
+            if raise_errors:
+                raise
             return None
 
     def get_call_details(self, call_uid: int) -> Optional[Dict]:
         """Получает детальную информацию о звонке"""
         try:
-            url = "https://api.exolve.ru/statistics/call-history/v2/GetInfo"
-            payload = {"uid": int(call_uid)}
-
-            response = requests.post(url, headers=self.headers, json=payload, timeout=30)
-            response.raise_for_status()
-
-            return response.json()
-
+            return self._post(GET_INFO_URL, {"uid": int(call_uid)})
         except requests.exceptions.RequestException as e:
             logger.error(f"Ошибка получения деталей звонка {call_uid}: {e}")
             return None
@@ -99,7 +154,7 @@ class ExolveClient:
         """Тестирует подключение к API"""
         try:
             response = requests.get(
-                "https://api.exolve.ru/statistics/call-history/v2/GetList",
+                GET_LIST_URL,
                 headers=self.headers,
                 params={"limit": 1},
                 timeout=10
@@ -109,21 +164,116 @@ class ExolveClient:
             logger.error(f"API connection test failed: {e}")
             return False
 
+    @property
+    def transcript_catalog(self):
+        """Каталог расшифровок с превью; создаётся при первом обращении."""
+        if self._transcript_catalog is None:
+            from transcript_catalog import TranscriptCatalog
+            self._transcript_catalog = TranscriptCatalog(self)
+        return self._transcript_catalog
+
     def get_available_transcripts(self, hours_back: int = 24) -> List[Dict]:
         """Получает список звонков с доступными транскрипциями"""
-        calls = self.get_recent_calls(hours_back)
-        calls_with_transcripts = []
-
-        for call in calls:
-            call_uid = call.get("uid")
-            if call_uid:
-                transcript = self.get_call_transcript(call_uid)
-                if transcript and len(transcript) > 50:  # Минимум 50 символов
-                    calls_with_transcripts.append({
-                        "call_uid": call_uid,
-                        "transcript_length": len(transcript),
-                        "preview": transcript[:100] + "..." if len(transcript) > 100 else transcript,
-                        "call_data": call
-                    })
-
-        return calls_with_transcripts
+        return self.transcript_catalog.list_available(hours_back, min_length=50)
+
+
+class AsyncExolveClient:
+    """
+    Асинхронный вариант ExolveClient с теми же методами. Одна HTTP-сессия
+    на клиента, число одновременных запросов ограничено max_concurrency.
+    Использование: async with AsyncExolveClient() as client: ...
+    """
+
+    def __init__(
+            self,
+            max_concurrency: int = 100,
+            archive: Optional[ExolveArchive] = None,
+            replay: Optional[bool] = None,
+    ):
+        if aiohttp is None:
+            raise RuntimeError("Для AsyncExolveClient нужен пакет aiohttp")
+        self.replay = replay_enabled() if replay is None else replay
+        self.archive = _default_archive(archive, self.replay)
+        self.api_key = os.getenv("EXOLVE_API_KEY")
+        self.headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session: Optional["aiohttp.ClientSession"] = None
+        # Запись в архив — блокирующий gzip и файлы; уводим её с event loop в один фоновый поток
+        self._archive_writer: Optional[ThreadPoolExecutor] = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        if self._archive_writer is not None:
+            await asyncio.to_thread(self._archive_writer.shutdown, wait=True)
+            self._archive_writer = None
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=30),
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+            )
+        return self._session
+
+    async def _post(self, url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if self.replay:
+            data = await asyncio.to_thread(_replay_response, self.archive, url, payload)
+            if data is None:
+                raise aiohttp.ClientError(f"Ответа нет в архиве: {url} {payload}")
+            return data
+
+        async with self._semaphore:
+            async with self._get_session().post(url, json=payload) as response:
+                response.raise_for_status()
+                try:
+                    data = await response.json(content_type=None)
+                except ValueError as e:
+                    raise aiohttp.ClientError(f"Некорректный JSON в ответе {url}: {e}") from e
+        # Пустое тело aiohttp отдаёт как None — считаем его сбоем запроса, как и синхронный клиент
+        if not isinstance(data, dict):
+            raise aiohttp.ClientError(f"Ответ API не является JSON-объектом: {url}")
+        if self.archive is not None:
+            if self._archive_writer is None:
+                self._archive_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="exolve-archive")
+            self._archive_writer.submit(self.archive.record, ARCHIVE_KINDS[url], payload, data)
+        return data
+
+    async def get_recent_calls(self, hours_back: int = 1) -> List[Dict]:
+        """Получает список последних звонков"""
+        try:
+            return _parse_calls(await self._post(GET_LIST_URL, _recent_calls_payload(hours_back)))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"API Error: {e}")
+            return []
+
+    async def get_call_transcript(self, call_uid: int, raise_errors: bool = False) -> Optional[str]:
+        """Получает транскрипцию звонка через POST /GetTranscribation (см. ExolveClient)"""
+        try:
+            logger.info(f"Получение расшифровки для звонка {call_uid}")
+            resp = await self._post(GET_TRANSCRIBATION_URL, {"uid": int(call_uid)})
+            return _parse_transcript(call_uid, resp)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Ошибка получения транскрипции для звонка {call_uid}: {e}")
+            if raise_errors:
+                raise
+            return None
+
+    async def get_call_details(self, call_uid: int) -> Optional[Dict]:
+        """Получает детальную информацию о звонке"""
+        try:
+            return await self._post(GET_INFO_URL, {"uid": int(call_uid)})
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Ошибка получения деталей звонка {call_uid}: {e}")
+            return None
@@ -0,0 +1,172 @@
+import argparse
+import csv
+import json
+import logging
+import os
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+from search_index import index_file
+from sheet_utils import DEFAULT_HEADERS, in_date_range, get_sheets_manager
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("csv", "xlsx", "parquet")
+PAGE_SIZE = 1000
+
+
+def iter_index_rows(path: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Строки из локального хранилища поискового индекса в формате листа.
+    Записи, сделанные до того, как индекс начал хранить Key Fear и
+    Desired Solution, выгружаются с пустыми значениями этих колонок
+    (их заполнит SearchIndex.rebuild_from_records по таблице).
+    """
+    path = path or index_file()
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                doc = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            yield {
+                "Timestamp": doc.get("timestamp", ""),
+                "Main Problem": doc.get("main_problem", ""),
+                "Key Fear": doc.get("key_fear", ""),
+                "Desired Solution": doc.get("result_solution", ""),
+                "Original Phrases": " | ".join(doc.get("original_phrases", [])),
+                "Tags": " | ".join(doc.get("tags", [])),
+            }
+
+
+def filter_rows(
+        rows: Iterable[Dict[str, Any]],
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Фильтр по периоду и тегам (любой из указанных), применяется на лету."""
+    wanted = {t.strip().lower() for t in tags or [] if t.strip()}
+    for row in rows:
+        if not in_date_range(str(row.get("Timestamp", "")), date_from, date_to):
+            continue
+        if wanted:
+            row_tags = {t.strip().lower() for t in str(row.get("Tags", "")).split(" | ")}
+            if not wanted & row_tags:
+                continue
+        yield row
+
+
+def _write_csv(rows: Iterable[Dict[str, Any]], path: str) -> int:
+    count = 0
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=DEFAULT_HEADERS, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def _write_xlsx(rows: Iterable[Dict[str, Any]], path: str) -> int:
+    from openpyxl import Workbook
+
+    # write_only: строки сбрасываются на диск, а не копятся в памяти
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Insights")
+    ws.append(DEFAULT_HEADERS)
+    count = 0
+    for row in rows:
+        ws.append([row.get(h, "") for h in DEFAULT_HEADERS])
+        count += 1
+    wb.save(path)
+    return count
+
+
+def _write_parquet(rows: Iterable[Dict[str, Any]], path: str) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Для экспорта в Parquet нужен пакет pyarrow")
+
+    schema = pa.schema([(h, pa.string()) for h in DEFAULT_HEADERS])
+    count = 0
+    batch: List[Dict[str, str]] = []
+    with pq.ParquetWriter(path, schema) as writer:
+        for row in rows:
+            batch.append({h: str(row.get(h, "")) for h in DEFAULT_HEADERS})
+            if len(batch) >= PAGE_SIZE:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+        if batch or not count:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
+
+
+_WRITERS = {"csv": _write_csv, "xlsx": _write_xlsx, "parquet": _write_parquet}
+
+
+def export_feed(
+        path: str,
+        fmt: str = "csv",
+        sheet_url: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        page_size: int = PAGE_SIZE,
+) -> int:
+    """
+    Потоковый экспорт фида в файл. Источник — таблица (sheet_url),
+    иначе локальное хранилище индекса. Возвращает число выгруженных строк.
+    """
+    if fmt not in _WRITERS:
+        raise ValueError(f"Неизвестный формат экспорта: {fmt}")
+
+    if sheet_url:
+        rows = get_sheets_manager().iter_rows(sheet_url, page_size, date_from, date_to)
+    else:
+        rows = iter_index_rows()
+
+    count = _WRITERS[fmt](filter_rows(rows, date_from, date_to, tags), path)
+    logger.info(f"Экспортировано строк: {count} -> {path}")
+    return count
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Экспорт фида инсайтов")
+    parser.add_argument("output", help="Путь к выходному файлу")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, help="По умолчанию — по расширению файла")
+    parser.add_argument("--sheet-url", default=os.getenv("GOOGLE_SHEETS_URL"))
+    parser.add_argument(
+        "--local",
+        action="store_true",
+        help="Читать из локального хранилища поиска, а не из таблицы. В старых записях "
+             "Key Fear и Desired Solution пусты, пока индекс не перестроен по таблице",
+    )
+    parser.add_argument("--date-from", help="YYYY-MM-DD[ HH:MM:SS]")
+    parser.add_argument("--date-to", help="YYYY-MM-DD[ HH:MM:SS]")
+    parser.add_argument("--tag", action="append", help="Фильтр по тегу, можно несколько")
+    args = parser.parse_args()
+
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip(".").lower()
+    export_feed(
+        args.output,
+        fmt=fmt,
+        sheet_url=None if args.local else args.sheet_url,
+        date_from=args.date_from,
+        date_to=args.date_to,
+        tags=args.tag,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import json
+import re
+import threading
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Ожидаемая структура ответов модели: поле -> тип
+ANALYSIS_SCHEMA = {
+    "main_problem": str,
+    "key_fear": str,
+    "result_solution": str,
+    "original_phrases": list,
+    "tags": list,
+}
+
+INSIGHTS_SCHEMA = {
+    "product_insights": list,
+    "feature_suggestions": list,
+    "ux_improvements": list,
+    "priority_level": str,
+}
+
+DIGEST_SCHEMA = {
+    "summary": str,
+    "top_problems": list,
+    "top_fears": list,
+    "desired_outcomes": list,
+    "notable_quotes": list,
+    "tags": list,
+}
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?")
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "„": '"'})
+
+
+class ParseStats:
+    """Потокобезопасные счётчики результатов разбора JSON по типам ответов."""
+
+    OUTCOMES = ("ok", "extracted", "repaired", "failed", "reask")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def record(self, kind: str, outcome: str):
+        with self._lock:
+            bucket = self._counters.setdefault(kind, dict.fromkeys(self.OUTCOMES, 0))
+            bucket[outcome] = bucket.get(outcome, 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Копия счётчиков с долей неудачных разборов для каждого типа."""
+        with self._lock:
+            result = {}
+            for kind, bucket in self._counters.items():
+                total = sum(bucket[o] for o in ("ok", "extracted", "repaired", "failed"))
+                result[kind] = dict(bucket, total=total,
+                                    failure_rate=bucket["failed"] / total if total else 0.0)
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+parse_stats = ParseStats()
+
+
+class JsonStreamExtractor:
+    """
+    Инкрементальный поиск первого JSON-объекта в потоке текста.
+    Текст подаётся кусками через feed(); преамбулы, markdown-ограждения
+    и хвосты после объекта игнорируются. finish() пытается достроить
+    объект, оборванный лимитом токенов.
+    """
+
+    def __init__(self):
+        self._buf: List[str] = []
+        self._stack: List[str] = []
+        # Точки, где можно обрезать оборванный хвост: (длина буфера, открытые скобки).
+        # Это позиции сразу после открывающей скобки и перед каждой запятой —
+        # всё, что левее, уже полные члены объектов и массивов.
+        self._cuts: List[Tuple[int, Tuple[str, ...]]] = []
+        self._in_string = False
+        self._escape = False
+        self.result: Optional[Dict[str, Any]] = None
+        self.repaired = False
+
+    def feed(self, chunk: str) -> Optional[Dict[str, Any]]:
+        if self.result is not None:
+            return self.result
+
+        for ch in chunk:
+            if not self._stack:
+                if ch == "{":
+                    self._buf = [ch]
+                    self._stack.append("}")
+                    self._cuts = [(1, ("}",))]
+                continue
+
+            self._buf.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch == ",":
+                self._cuts.append((len(self._buf) - 1, tuple(self._stack)))
+            elif ch in "{[":
+                self._stack.append("}" if ch == "{" else "]")
+                self._cuts.append((len(self._buf), tuple(self._stack)))
+            elif ch in "}]":
+                if self._stack and self._stack[-1] == ch:
+                    self._stack.pop()
+                if not self._stack:
+                    parsed, repaired = _loads_with_repair("".join(self._buf))
+                    if isinstance(parsed, dict):
+                        self.result, self.repaired = parsed, repaired
+                        return self.result
+                    # Фигурные скобки в преамбуле — ищем следующий объект
+                    self._buf = []
+        return None
+
+    def finish(self) -> Optional[Dict[str, Any]]:
+        """
+        Завершает поток: при обрыве закрывает строку и открытые скобки. Если хвост
+        так не чинится (оборван ключ, двоеточие без значения, «tru»), он
+        отрезается до последнего полного члена — полученные поля сохраняются.
+        """
+        if self.result is not None or not self._stack:
+            return self.result
+
+        tail = "".join(self._buf)
+        if self._in_string:
+            tail += '"'
+        tail = tail.rstrip().rstrip(",")
+        candidates = [tail + "".join(reversed(self._stack))]
+        candidates.extend(
+            "".join(self._buf[:pos]) + "".join(reversed(stack)) for pos, stack in reversed(self._cuts)
+        )
+        for candidate in candidates:
+            parsed, _ = _loads_with_repair(candidate)
+            if isinstance(parsed, dict):
+                self.result, self.repaired = parsed, True
+                break
+        return self.result
+
+
+def _loads_with_repair(raw: str) -> Tuple[Optional[Any], bool]:
+    try:
+        return json.loads(raw), False
+    except json.JSONDecodeError:
+        pass
+
+    fixed = _TRAILING_COMMA_RE.sub(r"\1", raw)
+    for candidate in (fixed, fixed.translate(_SMART_QUOTES)):
+        try:
+            return json.loads(candidate), True
+        except json.JSONDecodeError:
+            continue
+    return None, False
+
+
+def extract_json(text: str, kind: str = "generic") -> Optional[Dict[str, Any]]:
+    """
+    Достаёт JSON-объект из ответа модели: сначала прямой разбор,
+    затем поиск объекта внутри текста и мелкий ремонт (висячие запятые,
+    типографские кавычки, обрыв по лимиту токенов).
+    """
+    if not text:
+        parse_stats.record(kind, "failed")
+        return None
+
+    stripped = text.strip()
+    try:
+        data = json.loads(stripped)
+        if isinstance(data, dict):
+            parse_stats.record(kind, "ok")
+            return data
+    except json.JSONDecodeError:
+        pass
+
+    extractor = JsonStreamExtractor()
+    data = extractor.feed(_FENCE_RE.sub("", stripped)) or extractor.finish()
+    if data is None:
+        parse_stats.record(kind, "failed")
+        logger.warning(f"Не удалось извлечь JSON ({kind})")
+        return None
+
+    parse_stats.record(kind, "repaired" if extractor.repaired else "extracted")
+    return data
+
+
+def validate_schema(data: Dict[str, Any], schema: Dict[str, type]) -> List[str]:
+    """
+    Проверяет поля по схеме и возвращает список невалидных (отсутствующих,
+    пустых или не того типа). Строка на месте списка приводится к списку.
+    """
+    invalid = []
+    for field, expected in schema.items():
+        value = data.get(field)
+        if expected is list and isinstance(value, str) and value.strip():
+            data[field] = [value.strip()]
+            continue
+        if not isinstance(value, expected) or not value:
+            invalid.append(field)
+    return invalid
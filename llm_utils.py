@@ -1,49 +1,60 @@
+import asyncio
 import json
 import requests
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from config import LLM_CONFIG
+from json_utils import ANALYSIS_SCHEMA, DIGEST_SCHEMA, INSIGHTS_SCHEMA, extract_json, validate_schema, parse_stats
+
+try:
+    import aiohttp
+except ImportError:  # асинхронный процессор опционален
+    aiohttp = None
 
 logger = logging.getLogger(__name__)
 
+YANDEX_COMPLETION_URL = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+
+ANALYSIS_SYSTEM_TEXT = "Ты — продуктовый аналитик, который анализирует обращения клиентов."
+INSIGHTS_SYSTEM_TEXT = "Ты — продуктовый аналитик, который анализирует клиентские обращения для улучшения продукта."
+DIGEST_SYSTEM_TEXT = "Ты — продуктовый аналитик, который готовит сводки по клиентским обращениям за период."
+REASK_SYSTEM_TEXT = "Ты — продуктовый аналитик. Отвечай строго валидным JSON."
+
+
+class _CompletionError(Exception):
+    """Сбой запроса к completion API — общий для sync и async транспорта."""
+
+
+class BaseLLMProcessor:
+    """
+    Общая часть синхронного и асинхронного процессоров: промпты, разбор JSON,
+    перезапросы полей и фолбеки. Сценарии (_*_flow) — генераторы: они отдают
+    запросы (system_text, prompt, temperature) и получают текст ответа, а
+    транспорт (requests или aiohttp) подставляет наследник в _run.
+    """
 
-class LLMProcessor:
     def __init__(self, provider="yandex"):
         self.provider = provider
         self.config = LLM_CONFIG.get(provider, {})
 
-    def analyze_call(self, call_text: str) -> Optional[Dict[str, Any]]:
-        try:
-            if self.provider == "yandex":
-                return self._call_yandex_gpt(call_text)
-            else:
-                return self._fallback_analysis(call_text)
-        except Exception as e:
-            logger.error(f"Ошибка анализа звонка: {e}")
-            return None
-
-    def _call_yandex_gpt(self, call_text: str) -> Dict[str, Any]:
-        from prompts import get_analysis_prompt
-
-        url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+    def _completion_request(self, system_text: str, prompt: str, temperature: float):
+        """Заголовки и тело запроса к completion API (общие для sync и async)."""
         headers = {
             "Authorization": f"Api-Key {self.config['api_key']}",
             "Content-Type": "application/json"
         }
 
-        prompt = get_analysis_prompt(call_text)
-
         data = {
             "modelUri": f"gpt://{self.config['folder_id']}/{self.config['model']}",
             "completionOptions": {
                 "stream": False,
-                "temperature": self.config["temperature"],
+                "temperature": temperature,
                 "maxTokens": self.config["max_tokens"]
             },
             "messages": [
                 {
                     "role": "system",
-                    "text": "Ты — продуктовый аналитик, который анализирует обращения клиентов."
+                    "text": system_text
                 },
                 {
                     "role": "user",
@@ -51,92 +62,129 @@ class LLMProcessor:
                 }
             ]
         }
+        return headers, data
 
-        try:
-            response = requests.post(url, headers=headers, json=data, timeout=30)
-            response.raise_for_status()
+    @staticmethod
+    def _completion_text(result: Dict[str, Any]) -> str:
+        return result["result"]["alternatives"][0]["message"]["text"]
 
-            result = response.json()
-            response_text = result["result"]["alternatives"][0]["message"]["text"]
+    def _analysis_flow(self, call_text: str):
+        from prompts import get_analysis_prompt
 
-            try:
-                return json.loads(response_text.strip())
-            except json.JSONDecodeError as e:
-                logger.error(f"Ошибка парсинга JSON: {e}")
-                logger.info(f"Ответ от API: {response_text}")
-                return self._fallback_analysis(response_text)
+        if self.provider != "yandex":
+            return self._fallback_analysis(call_text)
 
-        except requests.exceptions.RequestException as e:
+        try:
+            response_text = yield ANALYSIS_SYSTEM_TEXT, get_analysis_prompt(call_text), self.config["temperature"]
+        except _CompletionError as e:
             logger.error(f"Ошибка запроса к Yandex GPT: {e}")
             return self._fallback_analysis(call_text)
 
-    def _fallback_analysis(self, text: str) -> Dict[str, Any]:
-        """Фолбек анализ когда основной не сработал"""
-        return {
-            "main_problem": "Не удалось определить проблему",
-            "key_fear": "Не удалось определить страх",
-            "result_solution": "Не удалось определить желаемый результат",
-            "original_phrases": ["Не удалось извлечь цитаты"],
-            "tags": ["неопределено"]
-        }
+        analysis = yield from self._structured_flow(response_text, "analysis", ANALYSIS_SCHEMA, call_text)
+        if analysis is None:
+            logger.error("Ошибка парсинга JSON: объект не найден в ответе")
+            logger.info(f"Ответ от API: {response_text}")
+            return self._fallback_analysis(response_text)
 
-    def generate_product_insights(self, analysis_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        try:
-            if self.provider == "yandex":
-                return self._generate_insights_with_yandex(analysis_data)
-            else:
-                return self._generate_fallback_insights(analysis_data)
-        except Exception as e:
-            logger.error(f"Ошибка генерации инсайтов: {e}")
-            return None
+        return self._fill_invalid(analysis, ANALYSIS_SCHEMA, self._fallback_analysis(call_text))
 
-    def _generate_insights_with_yandex(self, analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+    def _insights_flow(self, analysis_data: Dict[str, Any]):
         from prompts import get_product_insights_prompt
 
-        url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
-        headers = {
-            "Authorization": f"Api-Key {self.config['api_key']}",
-            "Content-Type": "application/json"
-        }
+        if self.provider != "yandex":
+            return self._generate_fallback_insights(analysis_data)
 
-        prompt = get_product_insights_prompt(analysis_data)
+        try:
+            response_text = yield INSIGHTS_SYSTEM_TEXT, get_product_insights_prompt(analysis_data), 0.7
+        except _CompletionError as e:
+            logger.error(f"Ошибка запроса для генерации инсайтов: {e}")
+            return self._generate_fallback_insights(analysis_data)
 
-        data = {
-            "modelUri": f"gpt://{self.config['folder_id']}/{self.config['model']}",
-            "completionOptions": {
-                "stream": False,
-                "temperature": 0.7,
-                "maxTokens": self.config["max_tokens"]
-            },
-            "messages": [
-                {
-                    "role": "system",
-                    "text": "Ты — продуктовый аналитик, который анализирует клиентские обращения для улучшения продукта."
-                },
-                {
-                    "role": "user",
-                    "text": prompt
-                }
-            ]
-        }
+        source_text = json.dumps(analysis_data, ensure_ascii=False)
+        insights = yield from self._structured_flow(response_text, "insights", INSIGHTS_SCHEMA, source_text)
+        if insights is None:
+            logger.error("Ошибка парсинга JSON инсайтов: объект не найден в ответе")
+            logger.info(f"Ответ от API: {response_text}")
+            return self._generate_fallback_insights(analysis_data)
+
+        return self._fill_invalid(insights, INSIGHTS_SCHEMA, self._generate_fallback_insights(analysis_data))
+
+    def _digest_flow(self, prompt: str, source: List[Dict[str, Any]]):
+        if self.provider != "yandex":
+            return self._fallback_digest(source)
 
         try:
-            response = requests.post(url, headers=headers, json=data, timeout=30)
-            response.raise_for_status()
+            response_text = yield DIGEST_SYSTEM_TEXT, prompt, self.config["temperature"]
+        except _CompletionError as e:
+            logger.error(f"Ошибка запроса для генерации дайджеста: {e}")
+            return self._fallback_digest(source)
 
-            result = response.json()
-            response_text = result["result"]["alternatives"][0]["message"]["text"]
+        digest = yield from self._structured_flow(response_text, "digest", DIGEST_SCHEMA, prompt)
+        if digest is None or len(validate_schema(digest, DIGEST_SCHEMA)) == len(DIGEST_SCHEMA):
+            # Ни одного пригодного поля — это тот же фолбек, его нельзя кэшировать как сводку LLM
+            logger.error("Ошибка парсинга JSON дайджеста: в ответе нет полей сводки")
+            return self._fallback_digest(source)
 
+        return self._fill_invalid(digest, DIGEST_SCHEMA, self._fallback_digest(source))
+
+    def _structured_flow(self, response_text: str, kind: str, schema: Dict[str, type], source_text: str):
+        """
+        Извлекает JSON из ответа и проверяет его по схеме. Невалидные поля
+        дозапрашиваются точечно, без повторного полного анализа.
+        """
+        data = extract_json(response_text, kind)
+        if data is None:
+            return None
+
+        invalid = validate_schema(data, schema)
+        attempts = self.config.get("json_reask_attempts", 1)
+        while invalid and attempts > 0:
+            attempts -= 1
             try:
-                return json.loads(response_text.strip())
-            except json.JSONDecodeError as e:
-                logger.error(f"Ошибка парсинга JSON инсайтов: {e}")
-                logger.info(f"Ответ от API: {response_text}")
-                return self._generate_fallback_insights(analysis_data)
+                patch_text = yield self._reask_args(kind, data, invalid, source_text)
+            except _CompletionError as e:
+                logger.error(f"Ошибка перезапроса полей: {e}")
+                break
+            invalid = self._merge_reask(kind, data, invalid, patch_text, schema)
 
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Ошибка запроса для генерации инсайтов: {e}")
-            return self._generate_fallback_insights(analysis_data)
+        return data
+
+    def _reask_args(self, kind: str, data: Dict[str, Any], invalid: List[str], source_text: str):
+        from prompts import get_field_reask_prompt
+
+        parse_stats.record(kind, "reask")
+        logger.info(f"Перезапрос полей {invalid} ({kind})")
+        prompt = get_field_reask_prompt(source_text, data, invalid)
+        return REASK_SYSTEM_TEXT, prompt, self.config["temperature"]
+
+    @staticmethod
+    def _merge_reask(
+            kind: str,
+            data: Dict[str, Any],
+            invalid: List[str],
+            patch_text: str,
+            schema: Dict[str, type],
+    ) -> List[str]:
+        patch = extract_json(patch_text, f"{kind}_reask") or {}
+        data.update({k: v for k, v in patch.items() if k in invalid})
+        return validate_schema(data, schema)
+
+    @staticmethod
+    def _fill_invalid(data: Dict[str, Any], schema: Dict[str, type], fallback: Dict[str, Any]) -> Dict[str, Any]:
+        """Подставляет фолбек только в поля, которые так и не удалось получить."""
+        for field in validate_schema(data, schema):
+            data[field] = fallback[field]
+        return data
+
+    def _fallback_analysis(self, text: str) -> Dict[str, Any]:
+        """Фолбек анализ когда основной не сработал"""
+        return {
+            "main_problem": "Не удалось определить проблему",
+            "key_fear": "Не удалось определить страх",
+            "result_solution": "Не удалось определить желаемый результат",
+            "original_phrases": ["Не удалось извлечь цитаты"],
+            "tags": ["неопределено"]
+        }
 
     def _generate_fallback_insights(self, analysis_data: Dict[str, Any]) -> Dict[str, Any]:
         """Фолбек инсайты когда основной запрос не сработал"""
@@ -163,6 +211,162 @@ class LLMProcessor:
             "priority_level": "medium"
         }
 
+    def _fallback_digest(self, source: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Фолбек дайджест: частотная сводка без LLM. Флаг fallback — чтобы не кэшировать."""
+        from collections import Counter
+
+        def top(*keys):
+            counter = Counter()
+            for item in source:
+                for key in keys:
+                    value = item.get(key)
+                    counter.update(value if isinstance(value, list) else [value] if value else [])
+            return [v for v, _ in counter.most_common(5)] or ["Нет данных"]
+
+        return {
+            "summary": f"Автоматическая сводка по {len(source)} записям без участия LLM",
+            "top_problems": top("main_problem", "top_problems"),
+            "top_fears": top("key_fear", "top_fears"),
+            "desired_outcomes": top("result_solution", "desired_outcomes"),
+            "notable_quotes": top("original_phrases", "notable_quotes"),
+            "tags": top("tags"),
+            "fallback": True,
+        }
+
+
+class LLMProcessor(BaseLLMProcessor):
+    def _completion(self, system_text: str, prompt: str, temperature: float) -> str:
+        """Один запрос к completion API, возвращает текст первой альтернативы."""
+        headers, data = self._completion_request(system_text, prompt, temperature)
+        response = requests.post(YANDEX_COMPLETION_URL, headers=headers, json=data, timeout=30)
+        response.raise_for_status()
+        result = response.json()
+        if not isinstance(result, dict):
+            raise requests.exceptions.RequestException("Ответ completion API не является JSON-объектом")
+        return self._completion_text(result)
+
+    def _run(self, flow):
+        """Прогоняет сценарий, выполняя его запросы синхронно."""
+        try:
+            request = next(flow)
+            while True:
+                try:
+                    text = self._completion(*request)
+                except requests.exceptions.RequestException as e:
+                    request = flow.throw(_CompletionError(str(e)))
+                else:
+                    request = flow.send(text)
+        except StopIteration as stop:
+            return stop.value
+
+    def analyze_call(self, call_text: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self._run(self._analysis_flow(call_text))
+        except Exception as e:
+            logger.error(f"Ошибка анализа звонка: {e}")
+            return None
+
+    def generate_product_insights(self, analysis_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        try:
+            return self._run(self._insights_flow(analysis_data))
+        except Exception as e:
+            logger.error(f"Ошибка генерации инсайтов: {e}")
+            return None
+
+    def summarize_calls(self, calls: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Сводка по пачке разборов звонков (map-шаг дайджеста)."""
+        from prompts import get_digest_map_prompt
+
+        return self._generate_digest(get_digest_map_prompt(calls), calls)
+
+    def merge_summaries(self, summaries: List[Dict[str, Any]], period: str) -> Optional[Dict[str, Any]]:
+        """Объединение частичных сводок (reduce-шаг дайджеста)."""
+        from prompts import get_digest_reduce_prompt
+
+        return self._generate_digest(get_digest_reduce_prompt(summaries, period), summaries)
+
+    def _generate_digest(self, prompt: str, source: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        try:
+            return self._run(self._digest_flow(prompt, source))
+        except Exception as e:
+            logger.error(f"Ошибка генерации дайджеста: {e}")
+            return None
+
+
+class AsyncLLMProcessor(BaseLLMProcessor):
+    """
+    Асинхронный процессор: analyze_call и generate_product_insights — корутины.
+    Сценарии, разбор JSON, перезапросы и фолбеки общие с LLMProcessor.
+    Использование: async with AsyncLLMProcessor() as llm: ...
+    """
+
+    def __init__(self, provider="yandex", max_concurrency: int = 50):
+        if aiohttp is None:
+            raise RuntimeError("Для AsyncLLMProcessor нужен пакет aiohttp")
+        super().__init__(provider)
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session: Optional["aiohttp.ClientSession"] = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=30),
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+            )
+        return self._session
+
+    async def _completion(self, system_text: str, prompt: str, temperature: float) -> str:
+        headers, data = self._completion_request(system_text, prompt, temperature)
+        async with self._semaphore:
+            async with self._get_session().post(YANDEX_COMPLETION_URL, headers=headers, json=data) as response:
+                response.raise_for_status()
+                try:
+                    result = await response.json(content_type=None)
+                except ValueError as e:
+                    raise aiohttp.ClientError(f"Некорректный JSON в ответе completion API: {e}") from e
+        if not isinstance(result, dict):
+            raise aiohttp.ClientError("Ответ completion API не является JSON-объектом")
+        return self._completion_text(result)
+
+    async def _run(self, flow):
+        """Прогоняет сценарий, выполняя его запросы через aiohttp."""
+        try:
+            request = next(flow)
+            while True:
+                try:
+                    text = await self._completion(*request)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    request = flow.throw(_CompletionError(str(e)))
+                else:
+                    request = flow.send(text)
+        except StopIteration as stop:
+            return stop.value
+
+    async def analyze_call(self, call_text: str) -> Optional[Dict[str, Any]]:
+        try:
+            return await self._run(self._analysis_flow(call_text))
+        except Exception as e:
+            logger.error(f"Ошибка анализа звонка: {e}")
+            return None
+
+    async def generate_product_insights(self, analysis_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        try:
+            return await self._run(self._insights_flow(analysis_data))
+        except Exception as e:
+            logger.error(f"Ошибка генерации инсайтов: {e}")
+            return None
+
 
 def analyze_call_with_llm(call_text: str, provider: str = "yandex") -> Optional[Dict[str, Any]]:
     processor = LLMProcessor(provider)
@@ -0,0 +1,146 @@
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SAMPLE_PERCENT = float(os.getenv("PROFILE_SAMPLE_PERCENT", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "100"))
+PROFILE_TRACEMALLOC = os.getenv("PROFILE_TRACEMALLOC", "true").lower() == "true"
+PROFILE_TOP_N = 30
+
+
+class RunProfiler:
+    """
+    Выборочное профилирование прогонов и запросов: cProfile + tracemalloc.
+    Профилируется sample_percent% вызовов; результат — .prof для snakeviz/pstats
+    и текстовый отчёт с топом функций и аллокаций. Хранится не больше max_files
+    последних профилей. При sample_percent=0 стоимость — одно сравнение.
+    """
+
+    def __init__(
+            self,
+            sample_percent: Optional[float] = None,
+            directory: Optional[str] = None,
+            max_files: Optional[int] = None,
+            trace_memory: Optional[bool] = None,
+    ):
+        self.sample_percent = PROFILE_SAMPLE_PERCENT if sample_percent is None else sample_percent
+        self.directory = directory or PROFILE_DIR
+        self.max_files = max_files or PROFILE_MAX_FILES
+        self.trace_memory = PROFILE_TRACEMALLOC if trace_memory is None else trace_memory
+        # cProfile и tracemalloc глобальны для процесса — профилируем один прогон за раз
+        self._busy = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_percent > 0
+
+    def start(self, name: str) -> Optional[Dict[str, Any]]:
+        """Начинает профиль, если вызов попал в выборку; иначе None."""
+        if not self.enabled or random.random() * 100 >= self.sample_percent:
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+
+        try:
+            started_tracemalloc = False
+            if self.trace_memory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracemalloc = True
+
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return {
+                "name": name,
+                "profiler": profiler,
+                "started": time.perf_counter(),
+                "started_tracemalloc": started_tracemalloc,
+            }
+        except Exception as e:
+            self._busy.release()
+            logger.error(f"Не удалось запустить профилирование: {e}")
+            return None
+
+    def stop(self, active: Optional[Dict[str, Any]]):
+        if active is None:
+            return
+        try:
+            active["profiler"].disable()
+            duration = time.perf_counter() - active["started"]
+            snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+            if active["started_tracemalloc"]:
+                tracemalloc.stop()
+            self._write(active["name"], active["profiler"], duration, snapshot)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения профиля: {e}")
+        finally:
+            self._busy.release()
+
+    @contextmanager
+    def profile(self, name: str):
+        active = self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(active)
+
+    def profiled(self, name: Optional[str] = None):
+        """Декоратор: профилирует выборку вызовов функции."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.profile(name or func.__name__):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _write(self, name: str, profiler: cProfile.Profile, duration: float, snapshot):
+        os.makedirs(self.directory, exist_ok=True)
+        safe_name = re.sub(r"[^0-9A-Za-z_.-]+", "_", name).strip("_") or "run"
+        base = os.path.join(self.directory, f"{datetime.now():%Y%m%d_%H%M%S_%f}_{safe_name}_{os.getpid()}")
+
+        profiler.dump_stats(f"{base}.prof")
+
+        report = io.StringIO()
+        report.write(f"{name}: {duration:.3f} s\n\n")
+        stats = pstats.Stats(profiler, stream=report)
+        stats.sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+        if snapshot is not None:
+            report.write(f"\nTop {PROFILE_TOP_N} allocations:\n")
+            for stat in snapshot.statistics("lineno")[:PROFILE_TOP_N]:
+                report.write(f"{stat}\n")
+        with open(f"{base}.txt", "w", encoding="utf-8") as f:
+            f.write(report.getvalue())
+
+        logger.info(f"Профиль {name} ({duration:.2f} s) сохранён: {base}.prof")
+        self._enforce_retention()
+
+    def _enforce_retention(self):
+        profiles = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(".prof")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in profiles[:max(0, len(profiles) - self.max_files)]:
+            for path in (entry.path, entry.path[:-len(".prof")] + ".txt"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+run_profiler = RunProfiler()
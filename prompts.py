@@ -1,3 +1,6 @@
+import json
+
+
 def get_analysis_prompt(call_text: str) -> str:
     return f"""Ты — самый опытный менеджер продукта. Анализируй обращение клиента в поддержку: находи корневую бизнес-боль, глубинный страх, желаемый результат и реальные цитаты клиента.
 Важно:
@@ -66,8 +69,75 @@ def get_product_insights_prompt(analysis_data: dict) -> str:
 - Приоритет определяй на основе влияния на пользовательский опыт
 
 Используй реальные цитаты клиента из original_phrases для обоснования инсайтов.
+
+Формат ответа (строго JSON, без пояснений до и после):
+{{
+"product_insights": ["Инсайт 1", "Инсайт 2", "Инсайт 3"],
+"feature_suggestions": ["Предложение 1", "Предложение 2"],
+"ux_improvements": ["Улучшение 1", "Улучшение 2"],
+"priority_level": "high | medium | low"
+}}
 """
 
 
+def get_field_reask_prompt(source_text: str, partial: dict, fields: list) -> str:
+    """Точечный перезапрос только недостающих полей вместо полного повтора анализа."""
+    fields_list = ", ".join(f'"{f}"' for f in fields)
+    return f"""Ранее ты вернул неполный ответ. Дополни только поля: {fields_list}.
+
+**Исходные данные:**
+{source_text}
+
+**Уже полученный ответ:**
+{json.dumps(partial, ensure_ascii=False)}
+
+Верни строго JSON-объект, содержащий только поля {fields_list}, без пояснений.
+Поля-списки возвращай массивами строк, остальные поля — строками."""
+
+
+_DIGEST_FORMAT = """Формат ответа (строго JSON, без пояснений до и после):
+{
+"summary": "2–4 предложения: о чём чаще всего обращались клиенты и что изменилось",
+"top_problems": ["Проблема (примерное число обращений)", "..."],
+"top_fears": ["Страх", "..."],
+"desired_outcomes": ["Желаемый результат", "..."],
+"notable_quotes": ["Точная цитата клиента", "..."],
+"tags": ["тег1", "тег2"]
+}"""
+
+
+def get_digest_map_prompt(calls: list) -> str:
+    """Сводка по пачке разборов отдельных звонков."""
+    lines = []
+    for i, call in enumerate(calls, start=1):
+        lines.append(
+            f"{i}. Проблема: {call.get('main_problem', '')}; Страх: {call.get('key_fear', '')}; "
+            f"Результат: {call.get('result_solution', '')}; Цитаты: {call.get('original_phrases', [])}; "
+            f"Теги: {call.get('tags', [])}"
+        )
+    calls_text = "\n".join(lines)
+    return f"""Ты — продуктовый аналитик. Ниже — разборы {len(calls)} обращений клиентов.
+Сгруппируй повторяющиеся проблемы, страхи и желаемые результаты, оцени частоту каждой группы.
+Цитаты бери только из приведённых, без перефразирования.
+
+**Разборы обращений:**
+{calls_text}
+
+{_DIGEST_FORMAT}"""
+
+
+def get_digest_reduce_prompt(summaries: list, period: str) -> str:
+    """Объединение частичных сводок в сводку за период."""
+    parts = "\n\n".join(
+        f"Сводка {i}:\n{json.dumps(s, ensure_ascii=False)}" for i, s in enumerate(summaries, start=1)
+    )
+    return f"""Ты — продуктовый аналитик. Объедини частичные сводки обращений клиентов в одну сводку за {period}.
+Складывай частоты одинаковых проблем, сохраняй самые показательные цитаты, не добавляй новых фактов.
+
+{parts}
+
+{_DIGEST_FORMAT}"""
+
+
 def get_webhook_analysis_prompt(call_text: str) -> str:
     return get_analysis_prompt(call_text)  # Можно использовать тот же промпт или кастомизировать
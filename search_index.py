@@ -0,0 +1,428 @@
+import heapq
+import json
+import logging
+import os
+import re
+import threading
+from array import array
+from contextlib import contextmanager
+from bisect import bisect_left
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Any, Iterable, List, Optional, Set
+
+try:
+    import fcntl
+except ImportError:  # Windows: межпроцессной блокировки нет
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_FILE = "search_index.jsonl"
+SEARCH_FIELDS = ("main_problem", "original_phrases", "tags")
+
+_WORD_RE = re.compile(r"[0-9a-zа-яё]+", re.IGNORECASE)
+_VOWELS = set("аеиоуыэюя")
+_MIN_WORD_LEN = 3
+# Служебные слова встречаются почти в каждой цитате и только раздувают выдачу
+STOP_WORDS = frozenset("""
+без больше был была были было быть вам вас вот все всё всего всех где даже для его если есть еще ещё
+или как когда кто меня мне мной может можно мой моя над нас нет них ничего она они оно опять очень
+под после потом почему при про раз сам свой себе себя так там тебя тем теперь тогда того тоже только
+том тут уже хоть чего чем что чтобы чтоб эта эти это этого этой этом этот
+""".split())
+
+
+# ——— Стеммер Портера для русского языка (Snowball) ———
+
+_PERFECTIVE_GERUND_1 = ("вшись", "вши", "в")
+_PERFECTIVE_GERUND_2 = ("ившись", "ывшись", "ивши", "ывши", "ив", "ыв")
+_REFLEXIVE = ("ся", "сь")
+_ADJECTIVE = (
+    "ими", "ыми", "его", "ого", "ему", "ому", "ее", "ие", "ые", "ое", "ей", "ий", "ый", "ой",
+    "ем", "им", "ым", "ом", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею",
+)
+_PARTICIPLE_1 = ("ем", "нн", "вш", "ющ", "щ")
+_PARTICIPLE_2 = ("ивш", "ывш", "ующ")
+_VERB_1 = ("ете", "йте", "ешь", "нно", "ла", "на", "ли", "ем", "ло", "но", "ет", "ют", "ны", "ть", "й", "л", "н")
+_VERB_2 = (
+    "ейте", "уйте", "ила", "ыла", "ена", "ите", "или", "ыли", "ило", "ыло", "ено", "ует", "уют",
+    "ены", "ить", "ыть", "ишь", "ей", "уй", "ил", "ыл", "им", "ым", "ен", "ят", "ит", "ыт", "ую", "ю",
+)
+_NOUN = (
+    "иями", "ями", "ами", "ией", "иям", "ием", "иях", "ев", "ов", "ие", "ье", "еи", "ии", "ей",
+    "ой", "ий", "ям", "ем", "ам", "ом", "ах", "ях", "ию", "ью", "ия", "ья",
+    "а", "е", "и", "й", "о", "у", "ы", "ь", "ю", "я",
+)
+_SUPERLATIVE = ("ейше", "ейш")
+_DERIVATIONAL = ("ость", "ост")
+
+
+@lru_cache(maxsize=None)
+def _longest_first(endings):
+    return sorted(endings, key=len, reverse=True)
+
+
+def _regions(word: str):
+    rv = r1 = r2 = len(word)
+    for i, ch in enumerate(word):
+        if ch in _VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i - 1] in _VOWELS and word[i] not in _VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i - 1] in _VOWELS and word[i] not in _VOWELS:
+            r2 = i + 1
+            break
+    return rv, r1, r2
+
+
+def _strip(word: str, start: int, endings, preceded_by_a: bool = False) -> Optional[str]:
+    """Отрезает самое длинное подходящее окончание, лежащее целиком в регионе."""
+    for ending in _longest_first(endings):
+        if not word.endswith(ending):
+            continue
+        cut = len(word) - len(ending)
+        if preceded_by_a:
+            if cut - 1 < start or word[cut - 1] not in "ая":
+                continue
+        elif cut < start:
+            continue
+        return word[:cut]
+    return None
+
+
+def _strip_group(word: str, start: int, group_1, group_2) -> Optional[str]:
+    candidates = [w for w in (_strip(word, start, group_1, True), _strip(word, start, group_2)) if w is not None]
+    return min(candidates, key=len) if candidates else None
+
+
+def stem_ru(word: str) -> str:
+    word = word.lower().replace("ё", "е")
+    rv, _, r2 = _regions(word)
+
+    # Шаг 1
+    stemmed = _strip_group(word, rv, _PERFECTIVE_GERUND_1, _PERFECTIVE_GERUND_2)
+    if stemmed is not None:
+        word = stemmed
+    else:
+        word = _strip(word, rv, _REFLEXIVE) or word
+        adjective = _strip(word, rv, _ADJECTIVE)
+        if adjective is not None:
+            word = _strip_group(adjective, rv, _PARTICIPLE_1, _PARTICIPLE_2) or adjective
+        else:
+            verb = _strip_group(word, rv, _VERB_1, _VERB_2)
+            if verb is not None:
+                word = verb
+            else:
+                word = _strip(word, rv, _NOUN) or word
+
+    # Шаг 2
+    if word.endswith("и") and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3
+    word = _strip(word, r2, _DERIVATIONAL) or word
+
+    # Шаг 4
+    if word.endswith("нн"):
+        word = word[:-1]
+    else:
+        superlative = _strip(word, rv, _SUPERLATIVE)
+        if superlative is not None:
+            word = superlative[:-1] if superlative.endswith("нн") else superlative
+        elif word.endswith("ь"):
+            word = word[:-1]
+    return word
+
+
+def _load_morph():
+    """Лемматизатор pymorphy, если установлен; иначе только стемминг."""
+    for module in ("pymorphy3", "pymorphy2"):
+        try:
+            return __import__(module).MorphAnalyzer()
+        except Exception:
+            continue
+    return None
+
+
+def index_file() -> str:
+    """Путь к хранилищу индекса; читается при вызове, а не при импорте модуля."""
+    return os.getenv("SEARCH_INDEX_FILE", DEFAULT_INDEX_FILE)
+
+
+def _trigrams(term: str) -> Set[str]:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """
+    Инвертированный индекс по цитатам, проблемам и тегам звонков.
+    Документы хранятся в append-only JSONL-файле; индекс в памяти
+    дочитывает только новые строки, поэтому несколько процессов
+    (демон, вебхук, Streamlit) видят записи друг друга без полной перестройки.
+    """
+
+    FUZZY_THRESHOLD = 0.45
+    PREFIX_MIN_LEN = 4
+    MAX_EXPANSIONS = 20
+
+    def __init__(self, path: Optional[str] = None, use_lemmatizer: bool = True):
+        self.path = path or index_file()
+        self._morph = _load_morph() if use_lemmatizer else None
+        self._lock = threading.Lock()
+        self._docs: List[Dict[str, Any]] = []
+        self._postings: Dict[str, array] = {}
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._sorted_terms: List[str] = []
+        self._terms_dirty = False
+        self._offset = 0
+        self._inode: Optional[int] = None
+        # Словарь цитат невелик, а лемматизация и стемминг — самая дорогая часть индексации
+        self._normalize = lru_cache(maxsize=200000)(self._normalize_word)
+        self.refresh()
+
+    # ——— нормализация ———
+
+    def _normalize_word(self, word: str) -> str:
+        if self._morph is not None:
+            word = self._morph.parse(word)[0].normal_form
+        return stem_ru(word)
+
+    def terms(self, text: str) -> List[str]:
+        return [
+            self._normalize(w) for w in _WORD_RE.findall(text.lower())
+            if len(w) >= _MIN_WORD_LEN and w not in STOP_WORDS
+        ]
+
+    # ——— запись ———
+
+    def _index_doc(self, doc: Dict[str, Any]):
+        doc_id = len(self._docs)
+        self._docs.append(doc)
+
+        parts = []
+        for field in SEARCH_FIELDS:
+            value = doc.get(field) or ""
+            parts.extend(value if isinstance(value, list) else [value])
+        for term in set(self.terms(" ".join(parts))):
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = array("I")
+                for gram in _trigrams(term):
+                    self._trigrams.setdefault(gram, set()).add(term)
+                self._terms_dirty = True
+            postings.append(doc_id)
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        Межпроцессная блокировка записи (fcntl, если доступен). Отдельный файл,
+        а не сам индекс: при перестройке индекс заменяется новым файлом.
+        """
+        with open(f"{self.path}.lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _reset(self):
+        self._docs, self._postings, self._trigrams = [], {}, {}
+        self._sorted_terms, self._terms_dirty, self._offset = [], False, 0
+
+    def refresh(self) -> int:
+        """Дочитывает строки, дописанные в файл с момента прошлого чтения."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return 0
+        if stat.st_ino == self._inode and stat.st_size == self._offset:
+            return 0
+        with self._lock:
+            return self._read_new()
+
+    def _read_new(self) -> int:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return 0
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            # Файл перестроен (возможно, другим процессом) — старые смещения недействительны
+            if self._inode is not None:
+                logger.info("Хранилище поискового индекса заменено, перечитываем целиком")
+            self._reset()
+            self._inode = stat.st_ino
+
+        added = 0
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            for line in iter(f.readline, b""):
+                if not line.endswith(b"\n"):
+                    break  # строка ещё дописывается другим процессом
+                self._offset += len(line)
+                try:
+                    self._index_doc(json.loads(line.decode("utf-8")))
+                    added += 1
+                except json.JSONDecodeError as e:
+                    logger.warning(f"Пропущена повреждённая строка индекса: {e}")
+        return added
+
+    def add(self, doc: Dict[str, Any]):
+        doc = {
+            "timestamp": doc.get("timestamp", ""),
+            "main_problem": doc.get("main_problem", "") or "",
+            "key_fear": doc.get("key_fear", "") or "",
+            "result_solution": doc.get("result_solution", "") or "",
+            "original_phrases": list(doc.get("original_phrases", []) or []),
+            "tags": list(doc.get("tags", []) or []),
+        }
+        line = (json.dumps(doc, ensure_ascii=False) + "\n").encode("utf-8")
+        # Под блокировкой дочитываем чужие строки и пишем свою —
+        # смещение берём из f.tell(), а не считаем само
+        with self._lock, self._file_lock(), open(self.path, "ab") as f:
+            self._read_new()
+            f.write(line)
+            f.flush()
+            self._offset = f.tell()
+            self._index_doc(doc)
+
+    def add_analysis(self, analysis_data: Dict[str, Any], timestamp: str):
+        self.add(dict(analysis_data, timestamp=timestamp))
+
+    def rebuild_from_records(self, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        Полная перестройка по строкам таблицы (формат get_all_records).
+        Документы, дописанные другими процессами, пока читалась таблица,
+        переносятся в новый файл; другие процессы заметят замену в refresh().
+        """
+        tmp_path = f"{self.path}.tmp"
+        count = 0
+        written = set()
+        started_at = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                doc = {
+                    "timestamp": str(record.get("Timestamp", "")),
+                    "main_problem": str(record.get("Main Problem", "")),
+                    "key_fear": str(record.get("Key Fear", "")),
+                    "result_solution": str(record.get("Desired Solution", "")),
+                    "original_phrases": [p for p in str(record.get("Original Phrases", "")).split(" | ") if p],
+                    "tags": [t for t in str(record.get("Tags", "")).split(" | ") if t],
+                }
+                f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+                written.add((doc["timestamp"], doc["main_problem"]))
+                count += 1
+
+        with self._lock, self._file_lock():
+            carried = self._appended_since(started_at, written)
+            if carried:
+                with open(tmp_path, "ab") as f:
+                    f.writelines(carried)
+                count += len(carried)
+            os.replace(tmp_path, self.path)
+            self._reset()
+            self._inode = None
+            self._read_new()
+        return count
+
+    def _appended_since(self, offset: int, known) -> List[bytes]:
+        """Полные строки, дописанные в текущий файл после offset и отсутствующие в known."""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < offset:
+            return []
+        lines = []
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    doc = json.loads(line.decode("utf-8"))
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    continue
+                if line.endswith(b"\n") and (doc.get("timestamp"), doc.get("main_problem")) not in known:
+                    lines.append(line)
+        return lines
+
+    # ——— поиск ———
+
+    def _expand(self, term: str) -> Dict[str, float]:
+        """Термины словаря, подходящие под термин запроса, с весами."""
+        if term in self._postings:
+            return {term: 1.0}
+
+        expansions: Dict[str, float] = {}
+        if len(term) >= self.PREFIX_MIN_LEN:
+            if self._terms_dirty:
+                self._sorted_terms = sorted(self._postings)
+                self._terms_dirty = False
+            i = bisect_left(self._sorted_terms, term)
+            while i < len(self._sorted_terms) and self._sorted_terms[i].startswith(term):
+                expansions[self._sorted_terms[i]] = 0.8
+                i += 1
+                if len(expansions) >= self.MAX_EXPANSIONS:
+                    return expansions
+
+        query_grams = _trigrams(term)
+        shared: Counter = Counter()
+        for gram in query_grams:
+            shared.update(self._trigrams.get(gram, ()))
+        for candidate, common in shared.most_common(self.MAX_EXPANSIONS * 5):
+            similarity = common / (len(query_grams) + len(_trigrams(candidate)) - common)
+            if similarity >= self.FUZZY_THRESHOLD:
+                expansions.setdefault(candidate, 0.7 * similarity)
+        return dict(sorted(expansions.items(), key=lambda kv: -kv[1])[:self.MAX_EXPANSIONS])
+
+    def search(self, query: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Ищет звонки по всем терминам запроса с учётом словоформ и опечаток.
+        Документы с большим числом совпавших терминов выше, при равенстве — новее.
+        """
+        query_terms = list(dict.fromkeys(self.terms(query)))
+        if not query_terms:
+            return []
+
+        with self._lock:
+            expanded = [self._expand(term) for term in query_terms]
+            if all(len(e) == 1 and t in e for t, e in zip(query_terms, expanded)):
+                # Все термины совпали точно: если документов со всеми терминами
+                # хватает на выдачу, они и есть лучшие — остальное не считаем
+                full = set(self._postings[query_terms[0]])
+                for term in query_terms[1:]:
+                    full.intersection_update(self._postings[term])
+                if len(full) >= limit:
+                    score = float(len(query_terms))
+                    return [dict(self._docs[doc_id], score=score) for doc_id in heapq.nlargest(limit, full)]
+
+            scores: Counter = Counter()
+            for term, expansions in zip(query_terms, expanded):
+                if len(expansions) == 1 and term in expansions:
+                    # Точное совпадение (вес 1.0): Counter.update считает в C
+                    scores.update(self._postings[term])
+                    continue
+                best: Dict[int, float] = {}
+                for candidate, weight in expansions.items():
+                    for doc_id in self._postings[candidate]:
+                        if weight > best.get(doc_id, 0.0):
+                            best[doc_id] = weight
+                scores.update(best)
+
+            ranked = heapq.nlargest(limit, scores.items(), key=lambda kv: (kv[1], kv[0]))
+            return [dict(self._docs[doc_id], score=round(score, 3)) for doc_id, score in ranked]
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+
+_search_index: Optional[SearchIndex] = None
+
+
+def get_search_index() -> SearchIndex:
+    global _search_index
+    if _search_index is None:
+        _search_index = SearchIndex()
+    return _search_index
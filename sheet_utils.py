@@ -2,8 +2,12 @@ import os
 import json
 import gspread
 import logging
+import threading
+import time
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from search_index import SearchIndex, get_search_index
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +21,27 @@ DEFAULT_HEADERS = [
 ]
 
 
+# Партиционирование фида по листам: none | monthly | rows.
+# Режим читается в конструкторе, а не при импорте: .env может загрузиться позже
+PARTITION_PREFIX = "feed_"
+PARTITION_INDEX_TITLE = "_partitions"
+PARTITION_INDEX_HEADERS = ["Partition", "Start", "Created"]
+# Партиции создают и другие процессы (демон, вебхук) — список перечитывается раз в минуту
+PARTITION_INDEX_TTL_SEC = 60
+
+
+def _expand_date_to(date_to: Optional[str]) -> Optional[str]:
+    # Дата без времени в date_to включает весь день
+    if date_to and len(date_to) == 10:
+        return f"{date_to} 23:59:59"
+    return date_to
+
+
+def in_date_range(timestamp: str, date_from: Optional[str], date_to: Optional[str]) -> bool:
+    date_to = _expand_date_to(date_to)
+    return (not date_from or timestamp >= date_from) and (not date_to or timestamp <= date_to)
+
+
 class GoogleSheetsManager:
     """
     Минимальный менеджер для работы с Google Sheets.
@@ -24,14 +49,37 @@ class GoogleSheetsManager:
       1) через путь к файлу сервисного аккаунта (ENV GOOGLE_SERVICE_ACCOUNT_FILE), или
       2) через JSON сервисного аккаунта в ENV GOOGLE_SERVICE_ACCOUNT_JSON.
     Можно также передать credentials_file / credentials_json прямо в конструктор.
+    Если передан search_index, каждая записанная строка сразу попадает в поисковый индекс.
+
+    Партиционирование (ENV GOOGLE_SHEETS_PARTITION):
+      none    — всё пишется в первый лист (по умолчанию);
+      monthly — отдельный лист feed_YYYY_MM на каждый месяц;
+      rows    — новый лист feed_NNNN, когда в текущем больше GOOGLE_SHEETS_PARTITION_ROWS строк.
+    Список партиций с началом периода хранится в служебном листе _partitions.
+    Листы-партиции не обходят лимит Google в 10 млн ячеек: он действует на весь
+    документ, а не на лист. Партиции ускоряют чтение и поиск по периоду; когда
+    документ приближается к лимиту, старые листы нужно перенести в архивный
+    документ, а в GOOGLE_SHEETS_URL указать новый.
     """
 
     def __init__(
             self,
             credentials_file: Optional[str] = None,
             credentials_json: Optional[str] = None,
+            search_index: Optional[SearchIndex] = None,
+            partition_mode: Optional[str] = None,
+            partition_rows: Optional[int] = None,
     ):
         self.client: Optional[gspread.Client] = None
+        self.search_index = search_index
+        self.partition_mode = (partition_mode or os.getenv("GOOGLE_SHEETS_PARTITION", "none")).lower()
+        self.partition_rows = partition_rows or int(os.getenv("GOOGLE_SHEETS_PARTITION_ROWS", "100000"))
+        self._spreadsheets: Dict[str, gspread.Spreadsheet] = {}
+        self._worksheets: Dict[Tuple[str, str], gspread.Worksheet] = {}
+        self._partitions: Dict[str, List[Dict[str, str]]] = {}
+        self._partitions_read_at: Dict[str, float] = {}
+        self._row_counts: Dict[Tuple[str, str], int] = {}
+        self._partition_lock = threading.Lock()
         self._authenticate(credentials_file, credentials_json)
 
     def _authenticate(
@@ -71,23 +119,166 @@ class GoogleSheetsManager:
             logger.error(f"Ошибка аутентификации Google Sheets: {e}")
             raise
 
+    def _open_spreadsheet(self, sheet_url: str) -> gspread.Spreadsheet:
+        spreadsheet = self._spreadsheets.get(sheet_url)
+        if spreadsheet is None:
+            spreadsheet = self._spreadsheets[sheet_url] = self.client.open_by_url(sheet_url)
+        return spreadsheet
+
     def _open_sheet(self, sheet_url: str):
-        return self.client.open_by_url(sheet_url).sheet1
+        return self._open_spreadsheet(sheet_url).sheet1
+
+    def _open_worksheet(self, sheet_url: str, title: str) -> gspread.Worksheet:
+        key = (sheet_url, title)
+        ws = self._worksheets.get(key)
+        if ws is None:
+            ws = self._worksheets[key] = self._open_spreadsheet(sheet_url).worksheet(title)
+        return ws
 
-    def ensure_headers(self, sheet_url: str, headers: Optional[List[str]] = None) -> bool:
+    def ensure_headers(
+            self,
+            sheet_url: str,
+            headers: Optional[List[str]] = None,
+            worksheet: Optional[gspread.Worksheet] = None,
+    ) -> bool:
         """Создаёт заголовки в первой строке, если их нет."""
         try:
-            ws = self._open_sheet(sheet_url)
+            ws = worksheet or self._open_sheet(sheet_url)
             headers = headers or DEFAULT_HEADERS
             existing = ws.row_values(1)
             if not existing:
                 ws.append_row(headers)
-                logger.info("Созданы заголовки таблицы")
+                logger.info(f"Созданы заголовки листа {ws.title}")
             return True
         except Exception as e:
             logger.error(f"Ошибка ensure_headers: {e}")
             return False
 
+    # ——— Партиционирование по листам ———
+
+    def _index_sheet(self, sheet_url: str) -> gspread.Worksheet:
+        """Служебный лист со списком партиций; создаётся при первом обращении."""
+        spreadsheet = self._open_spreadsheet(sheet_url)
+        try:
+            return self._open_worksheet(sheet_url, PARTITION_INDEX_TITLE)
+        except gspread.WorksheetNotFound:
+            ws = spreadsheet.add_worksheet(PARTITION_INDEX_TITLE, rows=100, cols=len(PARTITION_INDEX_HEADERS))
+            self.ensure_headers(sheet_url, PARTITION_INDEX_HEADERS, worksheet=ws)
+            # Данные, записанные до включения партиционирования, остаются в первом листе
+            legacy = spreadsheet.sheet1
+            if len(legacy.col_values(1)) > 1:
+                ws.append_row([legacy.title, "", self._now()])
+            self._worksheets[(sheet_url, PARTITION_INDEX_TITLE)] = ws
+            logger.info("Создан лист-индекс партиций")
+            return ws
+
+    def list_partitions(self, sheet_url: str, max_age: float = PARTITION_INDEX_TTL_SEC) -> List[Dict[str, str]]:
+        """
+        Партиции в порядке начала периода: [{"title", "start", "created"}].
+        Лист-индекс перечитывается, если кэш старше max_age секунд.
+        """
+        partitions = self._partitions.get(sheet_url)
+        if partitions is None or time.monotonic() - self._partitions_read_at.get(sheet_url, 0) > max_age:
+            records = self._index_sheet(sheet_url).get_all_records()
+            partitions = sorted(
+                (
+                    {"title": str(r["Partition"]), "start": str(r["Start"]), "created": str(r["Created"])}
+                    for r in records if r.get("Partition")
+                ),
+                key=lambda p: p["start"],
+            )
+            self._partitions[sheet_url] = partitions
+            self._partitions_read_at[sheet_url] = time.monotonic()
+        return partitions
+
+    def _create_partition(self, sheet_url: str, title: str, start: str) -> gspread.Worksheet:
+        spreadsheet = self._open_spreadsheet(sheet_url)
+        try:
+            ws = spreadsheet.worksheet(title)
+        except gspread.WorksheetNotFound:
+            ws = spreadsheet.add_worksheet(title, rows=1000, cols=len(DEFAULT_HEADERS) + 1)
+            logger.info(f"Создана партиция {title}")
+        self.ensure_headers(sheet_url, worksheet=ws)
+
+        # Перечитываем индекс: партицию мог только что зарегистрировать другой процесс
+        if title not in {p["title"] for p in self.list_partitions(sheet_url, max_age=0)}:
+            created = self._now()
+            self._index_sheet(sheet_url).append_row([title, start, created])
+            self._partitions[sheet_url] = sorted(
+                self._partitions[sheet_url] + [{"title": title, "start": start, "created": created}],
+                key=lambda p: p["start"],
+            )
+        self._worksheets[(sheet_url, title)] = ws
+        return ws
+
+    def _row_count(self, sheet_url: str, title: str) -> int:
+        key = (sheet_url, title)
+        if key not in self._row_counts:
+            self._row_counts[key] = len(self._open_worksheet(sheet_url, title).col_values(1))
+        return self._row_counts[key]
+
+    def _sheet_for_write(self, sheet_url: str, timestamp: str, n_rows: int) -> gspread.Worksheet:
+        """Лист, в который пойдут n_rows новых строк; при необходимости создаёт новую партицию."""
+        if self.partition_mode not in ("monthly", "rows"):
+            return self._open_sheet(sheet_url)
+
+        with self._partition_lock:
+            if self.partition_mode == "monthly":
+                title = f"{PARTITION_PREFIX}{timestamp[:7].replace('-', '_')}"
+                if title in {p["title"] for p in self.list_partitions(sheet_url)}:
+                    ws = self._open_worksheet(sheet_url, title)
+                else:
+                    ws = self._create_partition(sheet_url, title, f"{timestamp[:7]}-01 00:00:00")
+            else:
+                partitions = [
+                    p for p in self.list_partitions(sheet_url)
+                    if p["title"].startswith(PARTITION_PREFIX) and p["title"][len(PARTITION_PREFIX):].isdigit()
+                ]
+                current = partitions[-1]["title"] if partitions else None
+                if current is None or self._row_count(sheet_url, current) + n_rows > self.partition_rows:
+                    current = f"{PARTITION_PREFIX}{len(partitions) + 1:04d}"
+                    ws = self._create_partition(sheet_url, current, timestamp)
+                else:
+                    ws = self._open_worksheet(sheet_url, current)
+                self._row_counts[(sheet_url, current)] = self._row_count(sheet_url, current) + n_rows
+            return ws
+
+    def _sheets_for_read(self, sheet_url: str, date_from: Optional[str], date_to: Optional[str]) -> List[str]:
+        """Партиции, чей период [start, start следующей) пересекается с запросом."""
+        partitions = self.list_partitions(sheet_url)
+        date_to = _expand_date_to(date_to)
+        if date_from and len(date_from) == 10:
+            date_from = f"{date_from} 00:00:00"
+        selected = []
+        for i, partition in enumerate(partitions):
+            if not partition["start"]:
+                # Первый лист со старыми данными: писался до момента включения партиций
+                end = partition["created"]
+            else:
+                end = partitions[i + 1]["start"] if i + 1 < len(partitions) else None
+            if date_to and partition["start"] > date_to:
+                continue
+            if date_from and end is not None and end <= date_from:
+                continue
+            selected.append(partition["title"])
+        return selected
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    @staticmethod
+    def _build_row(analysis_data: Dict[str, Any], insights_data: Dict[str, Any]) -> List[str]:
+        return [
+            GoogleSheetsManager._now(),
+            analysis_data.get("main_problem", ""),
+            analysis_data.get("key_fear", ""),
+            analysis_data.get("result_solution", ""),
+            " | ".join(analysis_data.get("original_phrases", []) or []),
+            " | ".join(analysis_data.get("tags", []) or []),
+            "авто-анализ",
+        ]
+
     def append_analysis(
             self,
             sheet_url: str,
@@ -95,33 +286,102 @@ class GoogleSheetsManager:
             insights_data: Dict[str, Any],
     ) -> bool:
         try:
-            ws = self._open_sheet(sheet_url)
-
-            row_data = [
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                analysis_data.get("main_problem", ""),
-                analysis_data.get("key_fear", ""),
-                analysis_data.get("result_solution", ""),
-                " | ".join(analysis_data.get("original_phrases", []) or []),
-                " | ".join(analysis_data.get("tags", []) or []),
-                "авто-анализ",
-            ]
-
-            ws.append_row(row_data)
+            row = self._build_row(analysis_data, insights_data)
+            ws = self._sheet_for_write(sheet_url, row[0], 1)
+            ws.append_row(row)
             logger.info("Данные добавлены в таблицу")
+            self._index_rows([(analysis_data, row)])
             return True
         except Exception as e:
             logger.error(f"Ошибка добавления данных в таблицу: {e}")
             return False
 
-    def get_sheet_data(self, sheet_url: str) -> Optional[List[Dict]]:
+    def append_analyses(
+            self,
+            sheet_url: str,
+            items: List[Tuple[Dict[str, Any], Dict[str, Any]]],
+    ) -> bool:
+        """Пакетная запись: все строки уходят одним запросом append_rows."""
+        if not items:
+            return True
         try:
-            ws = self._open_sheet(sheet_url)
-            return ws.get_all_records()
+            rows = [self._build_row(analysis, insights) for analysis, insights in items]
+            ws = self._sheet_for_write(sheet_url, rows[0][0], len(rows))
+            ws.append_rows(rows)
+            logger.info(f"Добавлено строк в таблицу: {len(items)}")
+            self._index_rows([(analysis, row) for (analysis, _), row in zip(items, rows)])
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка пакетного добавления данных в таблицу: {e}")
+            return False
+
+    def _index_rows(self, items: List[Tuple[Dict[str, Any], List[str]]]):
+        """Ошибка индексации не должна ломать запись в таблицу."""
+        if self.search_index is None:
+            return
+        try:
+            for analysis_data, row in items:
+                self.search_index.add_analysis(analysis_data, timestamp=row[0])
+        except Exception as e:
+            logger.error(f"Ошибка обновления поискового индекса: {e}")
+
+    def get_sheet_data(
+            self,
+            sheet_url: str,
+            date_from: Optional[str] = None,
+            date_to: Optional[str] = None,
+    ) -> Optional[List[Dict]]:
+        """
+        Строки фида. При партиционировании читаются только листы, покрывающие
+        период [date_from, date_to] (строки вида "YYYY-MM-DD[ HH:MM:SS]").
+        """
+        try:
+            if self.partition_mode not in ("monthly", "rows"):
+                records = self._open_sheet(sheet_url).get_all_records()
+            else:
+                records = []
+                for title in self._sheets_for_read(sheet_url, date_from, date_to):
+                    records.extend(self._open_worksheet(sheet_url, title).get_all_records())
+
+            if date_from or date_to:
+                records = [r for r in records if in_date_range(str(r.get("Timestamp", "")), date_from, date_to)]
+            return records
         except Exception as e:
             logger.error(f"Ошибка получения данных из таблицы: {e}")
             return None
 
+    def iter_rows(
+            self,
+            sheet_url: str,
+            page_size: int = 1000,
+            date_from: Optional[str] = None,
+            date_to: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Постранично отдаёт строки фида, не загружая лист целиком:
+        в памяти одновременно не больше page_size строк.
+        """
+        if self.partition_mode not in ("monthly", "rows"):
+            worksheets = [self._open_sheet(sheet_url)]
+        else:
+            worksheets = [self._open_worksheet(sheet_url, t) for t in self._sheets_for_read(sheet_url, date_from, date_to)]
+
+        last_column = gspread.utils.rowcol_to_a1(1, len(DEFAULT_HEADERS))[:-1]
+        for ws in worksheets:
+            headers = ws.row_values(1) or DEFAULT_HEADERS
+            start = 2
+            while True:
+                page = ws.get(f"A{start}:{last_column}{start + page_size - 1}")
+                for values in page:
+                    if not any(values):
+                        continue
+                    record = dict(zip(headers, values + [""] * (len(headers) - len(values))))
+                    if in_date_range(str(record.get("Timestamp", "")), date_from, date_to):
+                        yield record
+                if len(page) < page_size:
+                    break
+                start += page_size
+
     def create_sheet_if_not_exists(self, sheet_url: str) -> bool:
         """Создаёт заголовки, если их ещё нет (таблица уже должна существовать)."""
         return self.ensure_headers(sheet_url)
@@ -134,7 +394,7 @@ _sheets_manager: Optional[GoogleSheetsManager] = None
 def get_sheets_manager() -> GoogleSheetsManager:
     global _sheets_manager
     if _sheets_manager is None:
-        _sheets_manager = GoogleSheetsManager()
+        _sheets_manager = GoogleSheetsManager(search_index=get_search_index())
     return _sheets_manager
 
 
@@ -150,9 +410,24 @@ def append_to_google_sheet(
         return False
 
 
-def get_google_sheet_data(sheet_url: str) -> Optional[List[Dict]]:
+def append_batch_to_google_sheet(
+        items: List[Tuple[Dict[str, Any], Dict[str, Any]]],
+        sheet_url: str,
+) -> bool:
+    try:
+        return get_sheets_manager().append_analyses(sheet_url, items)
+    except Exception as e:
+        logger.error(f"Ошибка append_batch_to_google_sheet: {e}")
+        return False
+
+
+def get_google_sheet_data(
+        sheet_url: str,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+) -> Optional[List[Dict]]:
     try:
-        return get_sheets_manager().get_sheet_data(sheet_url)
+        return get_sheets_manager().get_sheet_data(sheet_url, date_from, date_to)
     except Exception as e:
         logger.error(f"Ошибка get_google_sheet_data: {e}")
         return None
@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("dotenv")
+pytest.importorskip("requests")
+
+from exolve_client import AsyncExolveClient
+from llm_utils import AsyncLLMProcessor
+
+
+class FakeResponse:
+    def __init__(self, body: bytes):
+        self.body = body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    async def json(self, content_type="application/json"):
+        # Как aiohttp: пустое тело — None, иначе json.loads
+        return json.loads(self.body) if self.body else None
+
+
+class FakeSession:
+    """Подменяет aiohttp.ClientSession: отдаёт заранее заданные тела ответов по очереди."""
+
+    def __init__(self, *bodies: bytes):
+        self.bodies = list(bodies)
+        self.closed = False
+
+    def post(self, url, **kwargs):
+        return FakeResponse(self.bodies.pop(0))
+
+    async def close(self):
+        self.closed = True
+
+
+def _exolve(session):
+    client = AsyncExolveClient(archive=None, replay=False)
+    client._session = session
+    return client
+
+
+@pytest.fixture(autouse=True)
+def _no_archive(monkeypatch):
+    monkeypatch.setenv("EXOLVE_ARCHIVE_DIR", "")
+
+
+@pytest.mark.parametrize("body", [b"", b"<html>502</html>", b"[]"])
+def test_async_exolve_client_treats_bad_body_as_request_error(body):
+    async def scenario():
+        client = _exolve(FakeSession(body, body, body))
+        calls = await client.get_recent_calls()
+        details = await client.get_call_details(1)
+        transcript = await client.get_call_transcript(1)
+        return calls, details, transcript
+
+    assert asyncio.run(scenario()) == ([], None, None)
+
+
+def test_async_exolve_client_raises_on_bad_body_when_asked():
+    import aiohttp
+
+    async def scenario():
+        await _exolve(FakeSession(b"")).get_call_transcript(1, raise_errors=True)
+
+    with pytest.raises(aiohttp.ClientError):
+        asyncio.run(scenario())
+
+
+def test_async_exolve_client_parses_valid_body():
+    body = json.dumps({"transcribation": [{"chunks": [{"text": "Алло"}, {"text": "добрый день"}]}]}).encode()
+
+    async def scenario():
+        return await _exolve(FakeSession(body)).get_call_transcript(1)
+
+    assert asyncio.run(scenario()) == "Алло добрый день"
+
+
+@pytest.mark.parametrize("body", [b"", b"not json", b"\"text\""])
+def test_async_llm_processor_falls_back_on_bad_body(body):
+    async def scenario():
+        llm = AsyncLLMProcessor()
+        llm.config = {**llm.config, "api_key": "key", "folder_id": "folder"}
+        llm._session = FakeSession(body)
+        return await llm.analyze_call("Клиент жалуется, что деньги списали дважды")
+
+    analysis = asyncio.run(scenario())
+    assert analysis is not None
+    assert analysis == AsyncLLMProcessor()._fallback_analysis("Клиент жалуется, что деньги списали дважды")
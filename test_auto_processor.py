@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("requests")
+pytest.importorskip("gspread")
+
+import auto_processor
+from auto_processor import AutoCallProcessor
+from call_queue import CallPriorityQueue
+
+
+class FakeExolve:
+    def __init__(self, uids):
+        self.uids = uids
+
+    def get_recent_calls(self, hours_back):
+        return [{"uid": uid} for uid in self.uids]
+
+    def get_call_details(self, uid):
+        return {}
+
+
+def _processor(tmp_path, monkeypatch, uids=()):
+    monkeypatch.chdir(tmp_path)
+    processor = AutoCallProcessor.__new__(AutoCallProcessor)
+    processor.exolve_client = FakeExolve(list(uids))
+    processor.processed_uids = set()
+    processor.queue = CallPriorityQueue(path=str(tmp_path / "queue.json"), priority_numbers=set())
+    processor.run_budget_sec = 0
+    processor.last_new_calls = 0
+    processor.budget_exhausted = False
+    processor._stop_event = threading.Event()
+    return processor
+
+
+def test_next_interval_adapts_to_load():
+    assert AutoCallProcessor._next_interval(300, 10, 60, 1800, 10) == 150
+    assert AutoCallProcessor._next_interval(300, 0, 60, 1800, 10) == 450
+    assert AutoCallProcessor._next_interval(300, 3, 60, 1800, 10) == 300
+    assert AutoCallProcessor._next_interval(100, 50, 60, 1800, 10) == 60
+    assert AutoCallProcessor._next_interval(1500, 0, 60, 1800, 10) == 1800
+
+
+def test_next_interval_does_not_grow_while_backlog_waits():
+    assert AutoCallProcessor._next_interval(300, 0, 60, 1800, 10, backlog=True) == 300
+    assert AutoCallProcessor._next_interval(300, 10, 60, 1800, 10, backlog=True) == 150
+
+
+def test_process_new_calls_reports_stop_on_budget(tmp_path, monkeypatch):
+    processor = _processor(tmp_path, monkeypatch, uids=[1, 2, 3])
+    processor.run_budget_sec = 0.01
+
+    def slow_call(uid):
+        time.sleep(0.02)
+        return True
+
+    processor._process_call = slow_call
+    assert processor.process_new_calls() == 1
+    assert processor.budget_exhausted
+    assert len(processor.queue) == 2
+
+    processor.run_budget_sec = 0
+    processor.exolve_client.uids = []
+    assert processor.process_new_calls() == 2
+    assert not processor.budget_exhausted
+
+
+def test_runs_never_overlap_and_stop_ends_loop(tmp_path, monkeypatch):
+    monkeypatch.setattr(auto_processor.signal, "signal", lambda *_: None)
+    processor = _processor(tmp_path, monkeypatch)
+    runs = []
+
+    def fake_run():
+        started = time.monotonic()
+        # Прогон дольше интервала: следующий должен стартовать только после него
+        time.sleep(0.02)
+        runs.append((started, time.monotonic()))
+        if len(runs) == 3:
+            processor.stop()
+        return 0
+
+    processor.process_new_calls = fake_run
+    processor.run_continuously(interval_minutes=0.0001, min_interval_minutes=0.0001, max_interval_minutes=0.0002)
+    assert len(runs) == 3
+    assert all(prev_end <= start for (_, prev_end), (start, _) in zip(runs, runs[1:]))
+    assert (tmp_path / "queue.json").exists()
+
+
+def test_run_continuously_rejects_interval_longer_than_window(tmp_path, monkeypatch):
+    processor = _processor(tmp_path, monkeypatch)
+    with pytest.raises(ValueError):
+        processor.run_continuously(interval_minutes=5, max_interval_minutes=60)
@@ -0,0 +1,97 @@
+import io
+import threading
+import time
+import zipfile
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("requests")
+
+from batch_utils import iter_batch_analysis, iter_transcripts
+
+LONG_TEXT = "Клиент жалуется, что деньги списали дважды"
+
+
+class FakeLLM:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def analyze_call(self, text):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        if "сбой" in text:
+            raise RuntimeError("LLM недоступна")
+        return {"main_problem": text}
+
+    def generate_product_insights(self, analysis):
+        return {"product_insights": []}
+
+
+def _zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, raw in files:
+            archive.writestr(name, raw)
+    return buffer.getvalue()
+
+
+def test_csv_uses_recognized_text_column():
+    raw = "id,Текст\n1,первый звонок\n2,\n3,третий звонок\n"
+    assert list(iter_transcripts([("calls.csv", raw.encode("utf-8"))])) == [
+        ("calls.csv#2", "первый звонок"),
+        ("calls.csv#4", "третий звонок"),
+    ]
+
+
+def test_csv_without_header_keeps_first_line_as_data():
+    raw = "первый звонок,1\nвторой звонок,2\n".encode("cp1251")
+    assert list(iter_transcripts([("calls.csv", raw)])) == [
+        ("calls.csv#1", "первый звонок"),
+        ("calls.csv#2", "второй звонок"),
+    ]
+
+
+def test_zip_is_unpacked_recursively():
+    inner = _zip([("b.txt", "второй".encode("utf-8")), ("skip.pdf", b"%PDF")])
+    outer = _zip([("a.txt", "первый".encode("utf-8")), ("dir/inner.zip", inner)])
+    files = [("calls.zip", outer), ("broken.zip", b"not a zip")]
+    assert list(iter_transcripts(files)) == [
+        ("calls.zip/a.txt", "первый"),
+        ("calls.zip/dir/inner.zip/b.txt", "второй"),
+    ]
+
+
+def test_batch_analysis_keeps_bounded_window():
+    pulled = []
+    llm = FakeLLM(delay=0.01)
+
+    def transcripts():
+        for i in range(20):
+            pulled.append(i)
+            yield f"call{i}.txt", f"{LONG_TEXT} {i}"
+
+    results = []
+    for result in iter_batch_analysis(transcripts(), max_workers=3, processor=llm):
+        # Прочитано не больше, чем отдано, плюс окно из задач в работе
+        assert len(pulled) - len(results) <= 3
+        results.append(result)
+
+    assert len(results) == 20
+    assert llm.peak <= 3
+    assert all(r["error"] is None for r in results)
+
+
+def test_batch_analysis_reports_errors_per_item():
+    transcripts = [("short.txt", "мало"), ("bad.txt", f"{LONG_TEXT} сбой"), ("ok.txt", LONG_TEXT)]
+    results = {r["name"]: r for r in iter_batch_analysis(transcripts, max_workers=2, processor=FakeLLM())}
+    assert results["short.txt"]["error"] == "Слишком короткая расшифровка"
+    assert results["bad.txt"]["error"] == "LLM недоступна"
+    assert results["ok.txt"]["analysis"] == {"main_problem": LONG_TEXT}
@@ -0,0 +1,60 @@
+from call_queue import CallPriorityQueue, client_number, score_call
+
+
+def _queue(tmp_path, **kwargs):
+    return CallPriorityQueue(path=str(tmp_path / "queue.json"), priority_numbers=set(), **kwargs)
+
+
+def test_client_number_follows_direction():
+    outgoing = {"direction": "outgoing", "number_a": "84950000000", "number_b": "+7 916 111-22-33"}
+    incoming = {"direction": "incoming", "number_a": "89161112233", "number_b": "74950000000"}
+    assert client_number(outgoing) == client_number(incoming) == "79161112233"
+
+
+def test_score_prefers_long_incoming_and_priority_clients():
+    long_incoming = score_call({"duration": 600, "direction": "incoming"}, set())
+    misdial = score_call({"duration": 5, "direction": "incoming"}, set())
+    priority = score_call({"duration": 60, "number_a": "89161112233"}, {"79161112233"})
+    assert long_incoming > misdial
+    assert priority > long_incoming
+
+
+def test_outgoing_calls_from_one_line_are_not_repeat_callers(tmp_path):
+    queue = _queue(tmp_path)
+    for uid in range(1, 6):
+        queue.push({"uid": uid, "direction": "outgoing", "number_a": "74950000000",
+                    "number_b": f"7916000000{uid}", "duration": 120})
+    assert {entry["score"] for entry in queue.iter_by_priority()} == {2.0}
+
+
+def test_repeat_caller_gets_bonus(tmp_path):
+    queue = _queue(tmp_path)
+    for uid in (1, 2):
+        queue.push({"uid": uid, "direction": "incoming", "number_a": "79161112233", "duration": 60})
+    scores = {entry["uid"]: entry["score"] for entry in queue.iter_by_priority()}
+    assert scores["2"] == scores["1"] + 5
+
+
+def test_aging_lets_old_low_score_calls_overtake(tmp_path):
+    queue = _queue(tmp_path, aging_per_minute=1.0)
+    queue.push({"uid": 1, "duration": 60})
+    queue.push({"uid": 2, "duration": 600})
+    assert [e["uid"] for e in queue.iter_by_priority()] == ["2", "1"]
+
+    queue._pending["1"]["first_seen"] -= 60 * 60
+    assert [e["uid"] for e in queue.iter_by_priority()] == ["1", "2"]
+
+
+def test_given_up_calls_are_not_requeued_and_survive_restart(tmp_path):
+    queue = _queue(tmp_path, max_attempts=2)
+    queue.push({"uid": 7, "direction": "incoming", "number_a": "79161112233"})
+    assert queue.defer(7)
+    assert not queue.defer(7)
+    assert 7 not in queue and queue.gave_up(7)
+
+    queue.push({"uid": 7, "direction": "incoming", "number_a": "79161112233"})
+    assert 7 not in queue
+    assert queue._recent_numbers["79161112233"] and len(queue._recent_numbers["79161112233"]) == 1
+
+    queue.save()
+    assert _queue(tmp_path).gave_up(7)
@@ -0,0 +1,63 @@
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("requests")
+
+from digest import DigestEngine
+
+
+class FakeLLM:
+    def __init__(self):
+        self.calls = 0
+        self.down = False
+
+    def _summary(self, text):
+        self.calls += 1
+        if self.down:
+            return {"summary": "без участия LLM", "fallback": True}
+        return {"summary": text}
+
+    def summarize_calls(self, calls):
+        return self._summary(f"map {len(calls)}")
+
+    def merge_summaries(self, summaries, period):
+        return self._summary(f"reduce {period}")
+
+
+def _records(day, n):
+    return [{"Timestamp": f"{day} 10:{i:02d}:00", "Main Problem": f"проблема {i}"} for i in range(n)]
+
+
+def test_unchanged_days_are_served_from_cache(tmp_path):
+    llm = FakeLLM()
+    engine = DigestEngine(llm=llm, path=str(tmp_path / "cache.json"), chunk_size=2)
+    records = _records("2025-11-03", 4) + _records("2025-11-04", 2)
+
+    first = engine.build(records)
+    assert set(first["days"]) == {"2025-11-03", "2025-11-04"}
+    assert first["llm_calls"] == llm.calls > 0
+
+    assert DigestEngine(llm=llm, path=str(tmp_path / "cache.json"), chunk_size=2).build(records)["llm_calls"] == 0
+
+
+def test_new_call_recomputes_only_affected_nodes(tmp_path):
+    engine = DigestEngine(llm=FakeLLM(), path=str(tmp_path / "cache.json"), chunk_size=2)
+    records = _records("2025-11-03", 4) + _records("2025-11-04", 2)
+    engine.build(records)
+
+    # Новая пачка дня 04: map пачки, reduce дня, reduce недели
+    assert engine.build(records + _records("2025-11-04", 3)[2:])["llm_calls"] == 3
+
+
+def test_fallback_summaries_are_not_cached(tmp_path):
+    llm = FakeLLM()
+    engine = DigestEngine(llm=llm, path=str(tmp_path / "cache.json"), chunk_size=2)
+    records = _records("2025-11-03", 4)
+
+    llm.down = True
+    assert engine.build(records)["days"]["2025-11-03"]["fallback"]
+
+    llm.down = False
+    digest = engine.build(records)
+    assert digest["llm_calls"] == 3
+    assert "fallback" not in digest["days"]["2025-11-03"]
@@ -0,0 +1,72 @@
+import csv
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("gspread")
+
+from export_utils import _write_csv, _write_xlsx, export_feed, filter_rows
+from search_index import SearchIndex
+from sheet_utils import DEFAULT_HEADERS
+
+ROWS = [
+    {"Timestamp": "2025-10-31 23:59:59", "Main Problem": "Долгое ожидание", "Tags": "ожидание"},
+    {"Timestamp": "2025-11-01 10:00:00", "Main Problem": "Двойное списание", "Tags": "Оплата | возврат"},
+    {"Timestamp": "2025-11-30 18:00:00", "Main Problem": "Нет SMS", "Tags": "sms"},
+    {"Timestamp": "2025-12-01 00:00:00", "Main Problem": "Сбой приложения", "Tags": "приложение"},
+]
+
+
+def _problems(rows):
+    return [r["Main Problem"] for r in rows]
+
+
+def test_filter_rows_by_period_includes_whole_end_day():
+    rows = filter_rows(ROWS, date_from="2025-11-01", date_to="2025-11-30")
+    assert _problems(rows) == ["Двойное списание", "Нет SMS"]
+
+
+def test_filter_rows_by_any_tag_ignoring_case():
+    assert _problems(filter_rows(ROWS, tags=["оплата", "SMS", " "])) == ["Двойное списание", "Нет SMS"]
+    assert _problems(filter_rows(ROWS, tags=[" "])) == _problems(ROWS)
+
+
+def test_write_csv_keeps_column_order(tmp_path):
+    path = tmp_path / "feed.csv"
+    rows = [{**ROWS[1], "Extra": "не выгружается"}]
+    assert _write_csv(iter(rows), str(path)) == 1
+
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        lines = list(csv.reader(f))
+    assert lines[0] == DEFAULT_HEADERS
+    assert lines[1] == ["2025-11-01 10:00:00", "Двойное списание", "", "", "", "Оплата | возврат"]
+
+
+def test_write_xlsx_keeps_column_order(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    path = tmp_path / "feed.xlsx"
+    assert _write_xlsx(iter(ROWS), str(path)) == len(ROWS)
+
+    values = list(openpyxl.load_workbook(path).active.values)
+    assert list(values[0]) == DEFAULT_HEADERS
+    assert values[2][:2] == ("2025-11-01 10:00:00", "Двойное списание")
+    assert len(values) == len(ROWS) + 1
+
+
+def test_export_feed_from_local_index(tmp_path, monkeypatch):
+    index_path = tmp_path / "index.jsonl"
+    monkeypatch.setenv("SEARCH_INDEX_FILE", str(index_path))
+    index = SearchIndex(str(index_path), use_lemmatizer=False)
+    index.add({"timestamp": "2025-11-01 10:00:00", "main_problem": "Двойное списание",
+               "key_fear": "Потерять деньги", "result_solution": "Вернуть платёж", "tags": ["оплата"]})
+    index.add({"timestamp": "2025-11-02 10:00:00", "main_problem": "Нет SMS", "tags": ["sms"]})
+
+    path = tmp_path / "feed.csv"
+    assert export_feed(str(path), "csv", tags=["оплата"]) == 1
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        row = list(csv.DictReader(f))[0]
+    assert row["Key Fear"] == "Потерять деньги"
+    assert row["Desired Solution"] == "Вернуть платёж"
+
+    with pytest.raises(ValueError):
+        export_feed(str(path), "json")
@@ -0,0 +1,77 @@
+import json
+
+from json_utils import ANALYSIS_SCHEMA, JsonStreamExtractor, ParseStats, extract_json, validate_schema
+
+
+def test_extract_plain_json():
+    assert extract_json('{"a": 1}') == {"a": 1}
+
+
+def test_extract_from_fenced_reply_with_preamble():
+    text = 'Вот разбор звонка {кратко}:\n```json\n{"main_problem": "Списали деньги", "tags": ["оплата"]}\n```\nГотово.'
+    assert extract_json(text) == {"main_problem": "Списали деньги", "tags": ["оплата"]}
+
+
+def test_extract_repairs_trailing_commas_and_smart_quotes():
+    assert extract_json('{"tags": ["a", "b",],}') == {"tags": ["a", "b"]}
+    assert extract_json('Ответ: {“main_problem”: “долго ждать”}') == {"main_problem": "долго ждать"}
+
+
+def test_extract_closes_truncated_object():
+    assert extract_json('{"main_problem": "Не работает", "tags": ["прил') == {
+        "main_problem": "Не работает",
+        "tags": ["прил"],
+    }
+
+
+def test_extract_keeps_braces_inside_strings():
+    assert extract_json('{"quote": "скобка } внутри {"}') == {"quote": "скобка } внутри {"}
+
+
+def test_extract_returns_none_without_object():
+    assert extract_json("Не могу ответить") is None
+    assert extract_json("") is None
+
+
+def test_stream_extractor_accepts_chunks():
+    extractor = JsonStreamExtractor()
+    assert extractor.feed('преамбула {"a": [1, ') is None
+    assert extractor.feed('2]} хвост') == {"a": [1, 2]}
+    assert not extractor.repaired
+
+
+def test_validate_schema_reports_missing_and_coerces_strings():
+    data = {"main_problem": "", "key_fear": "страх", "result_solution": 3, "original_phrases": "цитата"}
+    assert validate_schema(data, ANALYSIS_SCHEMA) == ["main_problem", "result_solution", "tags"]
+    assert data["original_phrases"] == ["цитата"]
+
+
+def test_parse_stats_failure_rate():
+    stats = ParseStats()
+    for outcome in ("ok", "repaired", "failed", "reask"):
+        stats.record("analysis", outcome)
+    snapshot = stats.snapshot()["analysis"]
+    assert snapshot["total"] == 3
+    assert snapshot["failure_rate"] == 1 / 3
+
+
+def test_extract_keeps_complete_fields_at_every_cut_position():
+    analysis = {
+        "main_problem": "Списали деньги дважды",
+        "key_fear": "Потерять деньги",
+        "result_solution": "Вернуть списание",
+        "original_phrases": ["у меня списали два раза", "верните деньги"],
+        "tags": ["оплата", "возврат"],
+        "urgent": True,
+        "score": 12,
+    }
+    full = json.dumps(analysis, ensure_ascii=False)
+    value_ends = {key: full.index(json.dumps(value, ensure_ascii=False)) + len(json.dumps(value, ensure_ascii=False))
+                  for key, value in analysis.items()}
+
+    for cut in range(1, len(full)):
+        result = extract_json(full[:cut])
+        assert isinstance(result, dict), full[:cut]
+        for key, end in value_ends.items():
+            if end <= cut:
+                assert result.get(key) == analysis[key], full[:cut]
@@ -0,0 +1,74 @@
+from search_index import SearchIndex, stem_ru
+
+
+def _index(tmp_path, docs):
+    index = SearchIndex(str(tmp_path / "index.jsonl"), use_lemmatizer=False)
+    for doc in docs:
+        index.add(doc)
+    return index
+
+
+def test_stem_ru_reduces_word_forms_to_one_stem():
+    assert stem_ru("деньги") == stem_ru("деньгами")
+    assert stem_ru("клиенты") == stem_ru("клиентов")
+    assert stem_ru("списали") == stem_ru("списал")
+    assert stem_ru("Ёлка") == stem_ru("елки")
+
+
+def test_terms_drop_stop_words_and_short_tokens(tmp_path):
+    index = _index(tmp_path, [])
+    assert index.terms("не на я деньги") == [stem_ru("деньги")]
+
+
+def test_search_matches_word_forms_and_ranks_by_matched_terms(tmp_path):
+    index = _index(tmp_path, [
+        {"timestamp": "2025-11-01 10:00:00", "main_problem": "Списали деньги дважды", "tags": ["оплата"]},
+        {"timestamp": "2025-11-02 10:00:00", "main_problem": "Вернули деньгами на счёт", "tags": []},
+        {"timestamp": "2025-11-03 10:00:00", "main_problem": "Не работает приложение", "tags": ["приложение"]},
+    ])
+
+    results = index.search("деньги списали")
+    assert [r["timestamp"] for r in results] == ["2025-11-01 10:00:00", "2025-11-02 10:00:00"]
+    assert results[0]["score"] > results[1]["score"]
+    assert index.search("не на") == []
+
+
+def test_search_tolerates_typos(tmp_path):
+    index = _index(tmp_path, [{"main_problem": "Большая комиссия за перевод"}])
+    assert index.search("комиссея")
+
+
+def test_exact_match_fast_path_returns_newest_first(tmp_path):
+    index = _index(tmp_path, [{"timestamp": str(i), "main_problem": "деньги списали"} for i in range(5)])
+    assert [r["timestamp"] for r in index.search("деньги списали", limit=3)] == ["4", "3", "2"]
+
+
+def test_other_process_appends_are_picked_up(tmp_path):
+    first = _index(tmp_path, [{"main_problem": "первая жалоба"}])
+    second = SearchIndex(first.path, use_lemmatizer=False)
+    second.add({"main_problem": "вторая жалоба"})
+    first.add({"main_problem": "третья жалоба"})
+
+    assert len(first) == 3
+    second.refresh()
+    assert len(second) == 3
+    assert len(first.search("жалоба")) == 3
+
+
+def test_rebuild_is_picked_up_by_other_instances(tmp_path):
+    first = _index(tmp_path, [
+        {"timestamp": "1", "main_problem": "жалоба на связь"},
+        {"timestamp": "2", "main_problem": "жалоба на тариф"},
+    ])
+    second = SearchIndex(first.path, use_lemmatizer=False)
+
+    def records():
+        yield {"Timestamp": "3", "Main Problem": "вопрос по балансу"}
+        # Другой процесс дописал документ, пока читалась таблица
+        second.add({"timestamp": "4", "main_problem": "жалоба на роуминг"})
+
+    assert first.rebuild_from_records(records()) == 2
+    assert len(first) == 2
+    second.refresh()
+    assert sorted(d["timestamp"] for d in second._docs) == ["3", "4"]
+    assert [r["timestamp"] for r in second.search("жалоба")] == ["4"]
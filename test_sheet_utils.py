@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+pytest.importorskip("gspread")
+
+from sheet_utils import GoogleSheetsManager, in_date_range
+
+
+def _manager(partitions):
+    manager = GoogleSheetsManager.__new__(GoogleSheetsManager)
+    manager.partition_mode = "monthly"
+    manager._partitions = {"url": partitions}
+    manager._partitions_read_at = {"url": time.monotonic()}
+    return manager
+
+
+MONTHLY = [
+    {"title": "Sheet1", "start": "", "created": "2025-09-15 12:00:00"},
+    {"title": "feed_2025_09", "start": "2025-09-15 12:00:00", "created": "2025-09-15 12:00:00"},
+    {"title": "feed_2025_10", "start": "2025-10-01 00:00:00", "created": "2025-10-01 00:00:01"},
+    {"title": "feed_2025_11", "start": "2025-11-01 00:00:00", "created": "2025-11-01 00:00:02"},
+]
+
+
+def test_in_date_range_date_only_to_covers_whole_day():
+    assert in_date_range("2025-11-01 18:30:00", "2025-11-01", "2025-11-01")
+    assert not in_date_range("2025-11-02 00:00:00", None, "2025-11-01")
+
+
+def test_sheets_for_read_date_only_to_includes_partition_starting_that_day():
+    manager = _manager(MONTHLY)
+    assert manager._sheets_for_read("url", "2025-11-01", "2025-11-01") == ["feed_2025_11"]
+    assert manager._sheets_for_read("url", "2025-10-31", "2025-11-01") == ["feed_2025_10", "feed_2025_11"]
+
+
+def test_sheets_for_read_skips_partitions_outside_period():
+    manager = _manager(MONTHLY)
+    assert manager._sheets_for_read("url", "2025-10-05 00:00:00", "2025-10-20 00:00:00") == ["feed_2025_10"]
+    assert manager._sheets_for_read("url", None, "2025-09-01") == ["Sheet1"]
+    assert manager._sheets_for_read("url", "2025-12-01", None) == ["feed_2025_11"]
+
+
+def test_list_partitions_rereads_index_after_ttl():
+    manager = _manager(MONTHLY[:1])
+    manager._partitions_read_at["url"] -= 3600
+
+    class IndexSheet:
+        def get_all_records(self):
+            return [{"Partition": p["title"], "Start": p["start"], "Created": p["created"]} for p in MONTHLY]
+
+    manager._index_sheet = lambda url: IndexSheet()
+    assert [p["title"] for p in manager.list_partitions("url")][-1] == "feed_2025_11"
@@ -0,0 +1,74 @@
+import transcript_catalog
+from transcript_catalog import TranscriptCatalog
+
+
+class FakeClient:
+    def __init__(self, texts):
+        self.texts = texts
+        self.down = False
+        self.requests = []
+
+    def get_call_transcript(self, uid, raise_errors=False):
+        self.requests.append(uid)
+        if self.down:
+            raise ConnectionError("API недоступен")
+        return self.texts.get(uid)
+
+    def get_recent_calls(self, hours_back):
+        return [{"uid": uid} for uid in sorted(self.texts)]
+
+
+def _catalog(tmp_path, client, **kwargs):
+    return TranscriptCatalog(client, path=str(tmp_path / "catalog.json"), max_workers=2, **kwargs)
+
+
+def test_needs_fetch_rechecks_missing_after_ttl(tmp_path):
+    catalog = _catalog(tmp_path, FakeClient({1: "текст"}))
+    catalog.prefetch([1, 2])
+    checked_at = catalog.get_entry(2)["checked_at"]
+
+    assert not catalog._needs_fetch("1", checked_at + transcript_catalog.MISSING_TTL_SEC + 1)
+    assert not catalog._needs_fetch("2", checked_at + 1)
+    assert catalog._needs_fetch("2", checked_at + transcript_catalog.MISSING_TTL_SEC + 1)
+    assert catalog._needs_fetch("3", checked_at)
+
+
+def test_fetch_errors_are_not_recorded(tmp_path):
+    client = FakeClient({1: "текст звонка"})
+    client.down = True
+    catalog = _catalog(tmp_path, client)
+
+    assert catalog.prefetch([1]) == 0
+    assert catalog.get_entry(1) is None
+    assert catalog.get_transcript(1) is None
+    assert catalog.get_entry(1) is None
+
+    client.down = False
+    assert catalog.prefetch([1]) == 1
+    assert catalog.get_entry(1)["available"]
+
+
+def test_catalog_is_reused_from_disk(tmp_path):
+    client = FakeClient({1: "а" * 200, 2: "коротко"})
+    assert [c["call_uid"] for c in _catalog(tmp_path, client).list_available(min_length=50)] == [1]
+
+    client.requests.clear()
+    reloaded = _catalog(tmp_path, client)
+    assert [c["call_uid"] for c in reloaded.list_available(min_length=50)] == [1]
+    assert client.requests == []
+    assert reloaded.get_entry(1)["preview"].endswith("...")
+
+
+def test_text_cache_evicts_least_recently_used(tmp_path):
+    client = FakeClient({1: "первый", 2: "второй", 3: "третий"})
+    catalog = _catalog(tmp_path, client, cache_size=2)
+    catalog.prefetch([1, 2])
+    catalog.get_transcript(1)  # 1 становится самым свежим
+    catalog.prefetch([3])
+
+    client.requests.clear()
+    assert catalog.get_transcript(1) == "первый"
+    assert catalog.get_transcript(3) == "третий"
+    assert client.requests == []
+    assert catalog.get_transcript(2) == "второй"
+    assert client.requests == [2]
@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILE = os.getenv("TRANSCRIPT_CATALOG_FILE", "transcript_catalog.json")
+PREFETCH_WORKERS = int(os.getenv("TRANSCRIPT_PREFETCH_WORKERS", "8"))
+TEXT_CACHE_SIZE = int(os.getenv("TRANSCRIPT_CACHE_SIZE", "200"))
+PREVIEW_LEN = 100
+# Расшифровка появляется не сразу после звонка — пустой ответ перепроверяем через 10 минут
+MISSING_TTL_SEC = 600
+MAX_ENTRIES = 50000
+
+
+class TranscriptCatalog:
+    """
+    Каталог расшифровок: длина и превью хранятся вместе с метаданными звонка
+    на диске, полный текст подгружается только по запросу и держится в
+    небольшом LRU-кэше. Повторный просмотр списка стоит один запрос GetList;
+    расшифровки новых звонков скачиваются параллельно один раз.
+    """
+
+    def __init__(
+            self,
+            client,
+            path: str = CATALOG_FILE,
+            max_workers: int = PREFETCH_WORKERS,
+            cache_size: int = TEXT_CACHE_SIZE,
+    ):
+        self.client = client
+        self.path = path
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._texts: "OrderedDict[str, str]" = OrderedDict()
+        self._entries: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Каталог расшифровок повреждён, начинаем заново: {e}")
+            return {}
+
+    def _save(self):
+        with self._lock:
+            if len(self._entries) > MAX_ENTRIES:
+                newest = sorted(self._entries.items(), key=lambda kv: kv[1]["checked_at"])[-MAX_ENTRIES:]
+                self._entries = dict(newest)
+            snapshot = json.dumps(self._entries, ensure_ascii=False)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(snapshot)
+        os.replace(tmp_path, self.path)
+
+    def _remember(self, uid: str, text: Optional[str]):
+        with self._lock:
+            self._entries[uid] = {
+                "length": len(text) if text else 0,
+                "preview": (text[:PREVIEW_LEN] + "..." if len(text) > PREVIEW_LEN else text) if text else "",
+                "available": bool(text),
+                "checked_at": time.time(),
+            }
+            if text:
+                self._texts[uid] = text
+                self._texts.move_to_end(uid)
+                while len(self._texts) > self.cache_size:
+                    self._texts.popitem(last=False)
+
+    def _needs_fetch(self, uid: str, now: float) -> bool:
+        entry = self._entries.get(uid)
+        if entry is None:
+            return True
+        return not entry["available"] and now - entry["checked_at"] > MISSING_TTL_SEC
+
+    def _fetch(self, uid: str) -> Tuple[str, Optional[str], bool]:
+        """(uid, текст, ok); ok=False — сбой запроса, в каталог такой ответ не пишется."""
+        try:
+            return uid, self.client.get_call_transcript(int(uid), raise_errors=True), True
+        except Exception:
+            return uid, None, False
+
+    def prefetch(self, uids: Iterable) -> int:
+        """Параллельно скачивает расшифровки, которых ещё нет в каталоге."""
+        now = time.time()
+        missing = [str(uid) for uid in dict.fromkeys(uids) if self._needs_fetch(str(uid), now)]
+        if not missing:
+            return 0
+
+        logger.info(f"Загрузка расшифровок в каталог: {len(missing)}")
+        failed = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for uid, text, ok in executor.map(self._fetch, missing):
+                if ok:
+                    self._remember(uid, text)
+                else:
+                    failed += 1
+        if failed:
+            logger.warning(f"Не удалось загрузить расшифровок: {failed}, повторим при следующем запросе")
+        self._save()
+        return len(missing) - failed
+
+    def get_entry(self, call_uid) -> Optional[Dict[str, Any]]:
+        return self._entries.get(str(call_uid))
+
+    def get_transcript(self, call_uid) -> Optional[str]:
+        """Полный текст: из кэша, иначе одним запросом к API."""
+        uid = str(call_uid)
+        with self._lock:
+            text = self._texts.get(uid)
+            if text is not None:
+                self._texts.move_to_end(uid)
+                return text
+        _, text, ok = self._fetch(uid)
+        if ok:
+            self._remember(uid, text)
+        return text
+
+    def list_available(self, hours_back: int = 24, min_length: int = 50) -> List[Dict]:
+        """Звонки за период с расшифровкой не короче min_length символов."""
+        calls = self.client.get_recent_calls(hours_back)
+        self.prefetch(call["uid"] for call in calls if call.get("uid"))
+
+        result = []
+        for call in calls:
+            entry = self._entries.get(str(call.get("uid")))
+            if entry and entry["available"] and entry["length"] > min_length:
+                result.append({
+                    "call_uid": call["uid"],
+                    "transcript_length": entry["length"],
+                    "preview": entry["preview"],
+                    "call_data": call,
+                })
+        return result
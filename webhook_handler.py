@@ -1,11 +1,14 @@
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify
 import logging
 import os
 from dotenv import load_dotenv
 
 from exolve_client import ExolveWebhookProcessor
 from llm_utils import LLMProcessor
+from json_utils import parse_stats
+from profiling_utils import run_profiler
 from sheet_utils import GoogleSheetsManager
+from search_index import get_search_index
 
 load_dotenv()
 
@@ -20,7 +23,7 @@ app = Flask(__name__)
 
 # Инициализация компонентов
 try:
-    sheets_manager = GoogleSheetsManager()
+    sheets_manager = GoogleSheetsManager(search_index=get_search_index())
     llm_processor = LLMProcessor()
     webhook_processor = ExolveWebhookProcessor(sheets_manager, llm_processor)
     logger.info("Компоненты вебхука успешно инициализированы")
@@ -28,6 +31,17 @@ except Exception as e:
     logger.error(f"Ошибка инициализации компонентов: {e}")
     raise
 
+@app.before_request
+def start_request_profile():
+    if run_profiler.enabled:
+        g.profile = run_profiler.start(f"{request.method}_{request.path}")
+
+
+@app.teardown_request
+def stop_request_profile(exc):
+    run_profiler.stop(g.pop('profile', None))
+
+
 @app.route('/webhook/exolve', methods=['POST'])
 def handle_exolve_webhook():
     try:
@@ -94,7 +108,8 @@ def health_check():
                 "sheets_manager": "ok",
                 "llm_processor": "ok",
                 "webhook_processor": "ok"
-            }
+            },
+            "llm_json_parse": parse_stats.snapshot()
         }
         return jsonify(health_status)
     except Exception as e: